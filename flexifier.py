@@ -0,0 +1,856 @@
+# Flexifier pipeline without the streamlit interface: trace an image, place it,
+# add the hinges and export the model. Used by streamlit_app.py and flexifier_batch.py.
+import cadquery as cq
+import errno
+import multiprocessing
+import os
+import pickle
+import shutil
+import time
+import threading
+import tempfile
+import weakref
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from copy import deepcopy
+from io import BytesIO
+from importlib.util import find_spec
+from math import atan2, cos, degrees, radians, sin, sqrt
+import numpy as np
+import flexifier_trace
+import flexifier_outline
+from flexifier_cache import artifact_cache, artifact_key, digest, pack_outline, unpack_outline
+from flexifier_trace import trace, contours_to_svg, image_size
+from flexifier_outline import svg_outline, pixels_to_mm, place_outline, extrude_outline, simplify_outline, outline_segments
+from flexifier_export import shape_mesh, mesh_bytes, mesh_formats, linear_tolerance, angular_tolerance
+hor_tolerance= 0.8
+vert_tolerance= 0.8
+chamfer_multi = 1
+
+# The parts of a hinge are built once in a local frame, with the cut line along the Y axis
+# through the origin, and then moved in place with h_tran and h_rot.
+def cut_parts(h, height):
+    chamfer = h['h_break']*chamfer_multi
+    # cut image
+    cut_im =  cq.Workplane('XY').box(h['h_break'], h['h_break_len'],height,centered=(1,1,0))
+    # chamfer
+    chamfer_top = cq.Workplane('XY').box(chamfer, h['h_break_len'],chamfer).rotate([0,0,0], [0,1,0], 45)
+    chamfer_bot = cq.Workplane('XY').box(chamfer, h['h_break_len'],chamfer).rotate([0,0,0], [0,1,0], 45).translate([0,0,height])
+    return [(cut_im + chamfer_top + chamfer_bot).val()]
+
+def normal_hinge_parts(h, height):
+    # returns the solids to subtract from and to add to the model
+    ### Diff part
+    chamfer = h['h_break']*chamfer_multi
+    pin_diam = (h['h_diam']-vert_tolerance)/3
+    x_hinge = -h['h_break']/2-pin_diam/2
+    # hinge hole
+    hole_h_im_x = (h['h_diam'] + pin_diam)/2 + hor_tolerance
+    hole_im = cq.Workplane('XY').box(hole_h_im_x, h['h_thick']+hor_tolerance*2,height,centered=(1,1,0)).translate([-hole_h_im_x/2-h['h_break']/2,0,0])
+    ### Uni part
+    hole_diam = pin_diam + vert_tolerance
+    # hinge corner
+    hinge_corn = cq.Workplane('XZ').box(hole_h_im_x/2+chamfer*sqrt(2),h['h_diam'], h['h_thick'], centered=(0,0,1)).translate([-h['h_break']/2 -pin_diam/2,0,height/2-h['h_diam']/2])
+    # External hinge
+    hinge_ext =  cq.Workplane('XZ').cylinder(h['h_thick'], h['h_diam']/2, centered=(1,0,1)).translate([x_hinge,0,height/2-h['h_diam']/2])
+    hinge_hole =  cq.Workplane('XZ').cylinder(h['h_thick'], hole_diam/2, centered=(1,0,1)).translate([x_hinge,0,height/2-hole_diam/2])
+    hinge_pin =  cq.Workplane('XZ').cylinder(h['h_thick']+hor_tolerance*2, pin_diam/2, centered=(1,0,1)).translate([x_hinge,0,height/2-pin_diam/2])
+    return cut_parts(h, height) + [hole_im.val()], [(hinge_corn + hinge_ext - hinge_hole + hinge_pin).val()]
+
+def ball_joint_parts(h, height):
+    # returns the solids to subtract from and to add to the model
+    hole_diam = h['h_diam']+vert_tolerance
+    ### Diff part
+    hole_im1 = cq.Workplane('XY').sphere(hole_diam/2).translate([-h['h_break']/2-hole_diam/2,0,height/2])
+    hole_im2 = cq.Workplane('XY').sphere(hole_diam/2).translate([+h['h_break']/2+hole_diam/2,0,height/2])
+    if h['h_expose']:
+        hole_join = cq.Workplane('XY').box(h['h_break']+(h['h_diam']/2+hor_tolerance)*2, h['h_diam']/2+hor_tolerance,height,centered=(1,1,0))
+    else:
+        hole_join = cq.Workplane('YZ').cylinder(h['h_break']+h['h_diam'], h['h_diam']/4+hor_tolerance).translate([0,0,height/2])
+    ### Uni part
+    ball1 = cq.Workplane('XY').sphere(h['h_diam']/2).translate([-h['h_break']/2-hole_diam/2,0,height/2])
+    ball2 = cq.Workplane('XY').sphere(h['h_diam']/2).translate([+h['h_break']/2+hole_diam/2,0,height/2])
+    join = cq.Workplane('YZ').cylinder(h['h_break']+h['h_diam'], h['h_diam']/4).translate([0,0,height/2])
+    return cut_parts(h, height) + [(hole_im1 + hole_im2 + hole_join).val()], [(ball1 + ball2 + join).val()]
+
+def hinge_key(h, height):
+    # only the parameters that change the shape of the hinge in its local frame
+    if h['type'] == 'normal':
+        params = (h['h_diam'], h['h_thick'], h['h_break'], h['h_break_len'], None)
+    else:
+        params = (h['h_diam'], None, h['h_break'], h['h_break_len'], bool(h['h_expose']))
+    return (h['type'],) + tuple(round(float(p), 6) if p is not None and not isinstance(p, bool) else p for p in params) + (round(float(height), 6), hor_tolerance, vert_tolerance, chamfer_multi)
+
+def build_hinge_parts(h, height):
+    if h['type'] == 'normal':
+        return normal_hinge_parts(h, height)
+    return ball_joint_parts(h, height)
+
+class HingeCache:
+    # LRU cache of the local hinge parts, shared by all the sessions of the server
+    def __init__(self, maxsize=256, build=build_hinge_parts):
+        self.maxsize = maxsize
+        self.build = build
+        self.parts = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, h, height):
+        key = hinge_key(h, height)
+        with self.lock:
+            if key in self.parts:
+                self.parts.move_to_end(key)
+                self.hits += 1
+                return self.parts[key]
+            self.misses += 1
+        parts = self.build(h, height)
+        with self.lock:
+            self.parts[key] = parts
+            while len(self.parts) > self.maxsize:
+                self.parts.popitem(last=False)
+        return parts
+
+    def clear(self):
+        with self.lock:
+            self.parts.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'size': len(self.parts), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0}
+
+hinge_cache = HingeCache(int(os.environ.get('FLEXIFIER_HINGE_CACHE', 256)))
+
+def hinge_location(h):
+    return cq.Location(cq.Vector(h['h_tran'][0], h['h_tran'][1], 0), cq.Vector(0, 0, 1), h['h_rot'])
+
+def hinge_parts(h, height):
+    # the cached parts moved in place, moving a shape only changes its location
+    diff, uni = hinge_cache.get(h, height)
+    loc = hinge_location(h)
+    return [part.moved(loc) for part in diff], [part.moved(loc) for part in uni]
+
+def apply_parts(diff, uni, res):
+    for part in diff:
+        res -= part
+    for part in uni:
+        res += part
+    return res
+
+def no_progress(done, total, message=''):
+    pass
+
+def render_sequential(hinges, res, height, progress=no_progress):
+    # one boolean against the whole model for every hinge part, timed hinge by hinge
+    timings = dict()
+    for ind, (key, h) in enumerate(hinges.items()):
+        progress(ind, len(hinges), f'hinge {ind + 1} of {len(hinges)}')
+        start = time.time()
+        # the hinge type is dispatched by build_hinge_parts, through the cache
+        res = apply_parts(*hinge_parts(h, height), res)
+        timings[f'hinge {key}'] = time.time() - start
+    progress(len(hinges), len(hinges), 'hinges done')
+    return res, timings
+
+def render_batched(hinges, res, height, progress=no_progress):
+    # collect the parts of all the hinges and pass them as tools of a single cut and a single fuse
+    timings = dict()
+    start = time.time()
+    diff = list()
+    uni = list()
+    steps = len(hinges) + 2
+    for ind, h in enumerate(hinges.values()):
+        progress(ind, steps, f'parts of hinge {ind + 1} of {len(hinges)}')
+        h_diff, h_uni = hinge_parts(h, height)
+        diff += h_diff
+        uni += h_uni
+    timings['build parts'] = time.time() - start
+    start = time.time()
+    progress(len(hinges), steps, f'cut of {len(diff)} parts')
+    model = res.findSolid()
+    if diff:
+        model = model.cut(*diff)
+    timings['cut'] = time.time() - start
+    start = time.time()
+    progress(len(hinges) + 1, steps, f'fuse of {len(uni)} parts')
+    if uni:
+        model = model.fuse(*uni).clean()
+    timings['fuse'] = time.time() - start
+    progress(steps, steps, 'hinges done')
+    return cq.Workplane('XY').newObject([model]), timings
+
+piece_workers = int(os.environ.get('FLEXIFIER_PIECE_WORKERS', os.cpu_count() or 1))  # processes of the pieces render
+
+def shape_brep(shape):
+    buffer = BytesIO()
+    shape.exportBrep(buffer)
+    return buffer.getvalue()
+
+def brep_shape(data):
+    return cq.Shape.importBrep(BytesIO(data))
+
+def split_pieces(res, hinges):
+    # 2D split: the bottom faces of the model minus the cut of every hinge, a face for every piece
+    faces = res.faces('<Z').vals()
+    slots = [cq.Face.makeFromWires(cq.Wire.makePolygon([cq.Vector(x, y, 0) for x, y in (
+                (-h['h_break']/2, -h['h_break_len']/2), (h['h_break']/2, -h['h_break_len']/2),
+                (h['h_break']/2, h['h_break_len']/2), (-h['h_break']/2, h['h_break_len']/2))], close=True)).moved(hinge_location(h))
+             for h in hinges.values()]
+    if slots:
+        faces = [piece for face in faces for piece in face.cut(*slots).Faces()]
+    return faces
+
+def uni_solids(hinges, height):
+    # (hinge, number) of every solid added by the hinges and the solid
+    return [((ind, k), solid) for ind, h in hinges.items() for k, solid in enumerate(s for part in hinge_parts(h, height)[1] for s in part.Solids())]
+
+def render_piece(face, hinges, height):
+    # runs in a worker: extrusion of the piece, cut of the hinges next to it and fuse of the added
+    # solids touching it, the numbers of these solids are returned with the piece
+    face = brep_shape(face)
+    piece = cq.Solid.extrudeLinear(face.outerWire(), face.innerWires(), cq.Vector(0, 0, height))
+    diff = [part for h in hinges.values() for part in hinge_parts(h, height)[0]]
+    if diff:
+        piece = piece.cut(*diff)
+    if not piece.Solids():
+        return None, list()
+    box = piece.BoundingBox()
+    box = (box.xmin - 1e-3, box.ymin - 1e-3, box.xmax + 1e-3, box.ymax + 1e-3)
+    touching = list()
+    for key, solid in uni_solids(hinges, height):
+        solid_box = solid.BoundingBox()
+        if boxes_overlap(box, (solid_box.xmin, solid_box.ymin, solid_box.xmax, solid_box.ymax)) and piece.distance(solid) < 1e-6:
+            touching.append((key, solid))
+    if touching:
+        piece = piece.fuse(*[solid for _, solid in touching]).clean()
+    return shape_brep(piece), [key for key, _ in touching]
+
+def piece_pool_size(jobs):
+    # processes of the pieces pool: a render worker (a child process) gets its share of the cpus,
+    # the render_workers renders of the host do not start more processes than there are cpus
+    workers = piece_workers
+    if multiprocessing.parent_process() is not None:
+        workers = min(workers, max(1, (os.cpu_count() or 1) // render_workers))
+    return min(workers, jobs)
+
+def render_pieces(hinges, res, height, progress=no_progress):
+    # the model is split along the cuts and every piece is built with its hinges in a worker
+    # process, the pool lives as long as the render
+    timings = dict()
+    start = time.time()
+    faces = split_pieces(res, hinges)
+    boxes = {ind: hinge_box(h, height) for ind, h in hinges.items()}
+    jobs = list()
+    for face in faces:
+        box = face.BoundingBox()
+        near = {ind: h for ind, h in hinges.items() if boxes_overlap(boxes[ind], (box.xmin, box.ymin, box.xmax, box.ymax))}
+        jobs.append((shape_brep(face), near, height))
+    timings['split'] = time.time() - start
+    start = time.time()
+    progress(0, len(jobs), f'{len(jobs)} pieces')
+    results = list()
+    workers = piece_pool_size(len(jobs))
+    if multiprocessing.current_process().daemon or workers <= 1:
+        # a daemon process (the batch cli) cannot start workers
+        for ind, job in enumerate(jobs):
+            results.append(render_piece(*job))
+            progress(ind + 1, len(jobs), f'piece {ind + 1} of {len(jobs)}')
+    else:
+        pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+        try:
+            futures = [pool.submit(render_piece, *job) for job in jobs]
+            for ind, future in enumerate(as_completed(futures)):
+                progress(ind + 1, len(jobs), f'piece {ind + 1} of {len(jobs)}')
+            results = [future.result() for future in futures]
+        finally:
+            # a cancelled render does not start the pieces left
+            pool.shutdown(wait=True, cancel_futures=True)
+    timings['pieces'] = time.time() - start
+    start = time.time()
+    # the pieces touching the same added solid are fused together, the added solids not touching
+    # any piece (the link of a ball joint) are kept as they are; the pieces and solids of hinges
+    # overlapping each other are all fused, their added solids can overlap
+    shapes = {('piece', ind): brep_shape(data) for ind, (data, _) in enumerate(results) if data is not None}
+    owners = dict()
+    for ind, (_, keys) in enumerate(results):
+        for key in keys:
+            owners.setdefault(key, list()).append(('piece', ind))
+    for key, solid in uni_solids(hinges, height):
+        if key not in owners:
+            shapes[('uni', key)] = solid
+            owners[key] = [('uni', key)]
+    group = {node: node for node in shapes}
+    def root(node):
+        while group[node] != node:
+            node = group[node]
+        return node
+    def join(nodes):
+        for node in nodes[1:]:
+            group[root(node)] = root(nodes[0])
+    for nodes in owners.values():
+        join(nodes)
+    for ind in hinges:
+        for other in hinges:
+            if ind < other and boxes_overlap(boxes[ind], boxes[other]):
+                join([node for key, nodes in owners.items() if key[0] in (ind, other) for node in nodes])
+    groups = dict()
+    for node, shape in shapes.items():
+        groups.setdefault(root(node), list()).append(shape)
+    solids = list()
+    for shapes in groups.values():
+        solids += shapes[0].Solids() if len(shapes) == 1 else shapes[0].fuse(*shapes[1:]).clean().Solids()
+    timings['assemble'] = time.time() - start
+    return cq.Workplane('XY').newObject([cq.Compound.makeCompound(solids)]), timings
+
+render_modes = {'sequential': render_sequential, 'batched': render_batched, 'pieces': render_pieces}
+# the mesh backend (flexifier_mesh.py) needs the optional manifold3d package
+backends = ['cadquery', 'mesh'] if find_spec('manifold3d') else ['cadquery']
+
+def hinge_box(h, height):
+    # bounding box of all the parts of a hinge, padded to include the boolean tolerances
+    diff, uni = hinge_parts(h, height)
+    box = cq.Compound.makeCompound(diff + uni).BoundingBox()
+    return (box.xmin - 1, box.ymin - 1, box.xmax + 1, box.ymax + 1)
+
+def boxes_overlap(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+class RenderSession:
+    # keeps the last render of a session, when only some hinges change the booleans are
+    # computed again only inside their bounding boxes and spliced in the previous model
+    def __init__(self):
+        self.reset()
+        self.lock = threading.Lock()
+
+    def reset(self):
+        self.key = None
+        self.base = None
+        self.result = None
+        self.hinges = dict()
+        self.boxes = dict()
+
+    def __getstate__(self):
+        # the session goes to the render workers and back with its shapes as brep
+        state = {name: value for name, value in self.__dict__.items() if name != 'lock'}
+        for name in ('base', 'result'):
+            if state[name] is not None:
+                state[name] = [shape_brep(shape) for shape in state[name].vals()]
+        return state
+
+    def __setstate__(self, state):
+        for name in ('base', 'result'):
+            if state[name] is not None:
+                state[name] = cq.Workplane('XY').newObject([brep_shape(data) for data in state[name]])
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def render(self, key, build_base, hinges, render_mode, height, progress=no_progress):
+        # a cancelled render can still be running, the renders of a session wait for each other
+        with self.lock:
+            return self._render(key, build_base, hinges, render_mode, height, progress)
+
+    def _render(self, key, build_base, hinges, render_mode, height, progress):
+        # the new base, result and boxes are kept only when the whole render succeeds: a cancelled
+        # or failed render resets the session and the next render starts from the extrusion
+        hinges = deepcopy(hinges)
+        timings = dict()
+        try:
+            if key != self.key or self.result is None:
+                start = time.time()
+                progress(0, 1, 'extrude')
+                base = build_base()
+                timings['extrude'] = time.time() - start
+                result, hinge_timings = render_modes[render_mode](hinges, base, height, progress)
+                timings.update(hinge_timings)
+            else:
+                base, result = self.base, self.result
+                changed = [ind for ind in set(hinges) | set(self.hinges) if hinges.get(ind) != self.hinges.get(ind)]
+                if changed:
+                    result = self.update(changed, hinges, render_mode, height, timings, progress)
+            start = time.time()
+            boxes = {ind: hinge_box(h, height) for ind, h in hinges.items()}
+            timings['boxes'] = time.time() - start
+        except BaseException:
+            self.reset()
+            raise
+        self.key, self.base, self.result, self.hinges, self.boxes = key, base, result, hinges, boxes
+        return result, timings
+
+    def update(self, changed, hinges, render_mode, height, timings, progress):
+        start = time.time()
+        regions = [self.boxes[ind] for ind in changed if ind in self.boxes]
+        regions += [hinge_box(hinges[ind], height) for ind in changed if ind in hinges]
+        affected = {ind: h for ind, h in hinges.items() if any(boxes_overlap(hinge_box(h, height), r) for r in regions)}
+        base_box = self.base.findSolid().BoundingBox()
+        z_min, z_len = base_box.zmin - 1, base_box.zlen + 2
+        region = [cq.Solid.makeBox(r[2] - r[0], r[3] - r[1], z_len, cq.Vector(r[0], r[1], z_min)) for r in regions]
+        if len(region) > 1:
+            region = [region[0].fuse(*region[1:]).clean()]
+        region = cq.Workplane('XY').newObject(region)
+        timings['regions'] = time.time() - start
+        # booleans of the affected hinges only on the part of the base inside the regions
+        local = self.base.intersect(region)
+        local, hinge_timings = render_modes[render_mode](affected, local, height, progress)
+        timings.update(hinge_timings)
+        start = time.time()
+        local = local.intersect(region)
+        # splice the new regions in the previous model
+        model = self.result.findSolid().cut(region.findSolid()).fuse(local.findSolid())
+        # merging the faces can break the solids cut by the faces of the regions
+        cleaned = model.clean()
+        model = cleaned if cleaned.isValid() else model
+        timings['splice'] = time.time() - start
+        return cq.Workplane('XY').newObject([model])
+
+def default_workspace_root():
+    # tmpfs keeps the scratch files in memory when available
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+workspace_root = os.environ.get('FLEXIFIER_WORKSPACE_ROOT') or default_workspace_root()
+workspace_quota = int(os.environ.get('FLEXIFIER_WORKSPACE_QUOTA', 256 * 2**20))  # bytes per workspace
+
+class Workspace:
+    # scratch folder of a session or of a job, removed by close(), at the end of a with block,
+    # when the object is garbage collected (the streamlit session ends) or at exit
+    def __init__(self, quota=None, root=None):
+        self.quota = quota or workspace_quota
+        self.path = tempfile.mkdtemp(prefix='flexifier-', dir=root or workspace_root)
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.path, ignore_errors=True)
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    def exists(self, name):
+        return os.path.exists(self.file(name))
+
+    def remove(self, name):
+        if self.exists(name):
+            os.remove(self.file(name))
+
+    def usage(self):
+        return sum(entry.stat().st_size for entry in os.scandir(self.path) if entry.is_file())
+
+    def write(self, name, data):
+        old = os.path.getsize(self.file(name)) if self.exists(name) else 0
+        if self.usage() - old + len(data) > self.quota:
+            raise OSError(errno.EDQUOT, f'workspace quota of {self.quota} bytes exceeded', self.file(name))
+        mode = 'wb' if isinstance(data, bytes) else 'w'
+        with open(self.file(name), mode) as f:
+            f.write(data)
+        return self.file(name)
+
+    def check(self):
+        # after an external program wrote in the workspace
+        if self.usage() > self.quota:
+            raise OSError(errno.EDQUOT, f'workspace quota of {self.quota} bytes exceeded', self.path)
+
+    def close(self):
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+render_workers = int(os.environ.get('FLEXIFIER_RENDER_WORKERS', 2))  # renders running at the same time on the host
+render_pool = None
+render_manager = None
+
+class Cancelled(Exception):
+    pass
+
+def render_executor():
+    # the renders run in spawned processes, the booleans of OCC hold the GIL and in a thread of
+    # the server they would freeze the interface of every session; the manager process shares
+    # the progress and the cancel flag of the jobs with the workers
+    global render_pool, render_manager
+    if render_pool is None:
+        context = multiprocessing.get_context('spawn')
+        render_manager = context.Manager()
+        render_pool = ProcessPoolExecutor(render_workers, mp_context=context)
+    return render_pool, render_manager
+
+def run_render(target, args, kwargs, channel, cancel):
+    # runs in a render worker: the progress goes to the channel (a dict of the manager) and the
+    # render stops at the next progress report once cancel (an event of the manager) is set
+    if cancel.is_set():
+        raise Cancelled()
+    channel.update(status='running', started=time.time())
+
+    def progress(done, total, message=''):
+        if cancel.is_set():
+            raise Cancelled()
+        channel.update(progress=min(done / total, 1.0) if total else 1.0, message=message)
+
+    return target(*args, progress=progress, **kwargs)
+
+class RenderJob:
+    # render running in the background pool: the target is called in a worker process with a
+    # progress callback, cancel() stops it at the next progress report (a boolean already
+    # started is not interrupted); the target and its arguments must be picklable
+    def __init__(self, target, *args, **kwargs):
+        global render_pool
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.cached = False
+        self.started = None
+        self.finished = None
+        self._status = None
+        pool, manager = render_executor()
+        self._channel = manager.dict(status='queued', progress=0.0, message='waiting for a free worker', started=None)
+        self._cancel = manager.Event()
+        try:
+            self.future = pool.submit(run_render, target, args, kwargs, self._channel, self._cancel)
+        except BrokenProcessPool:
+            # a worker died (out of memory), the next jobs get a new pool
+            render_pool = None
+            pool, _ = render_executor()
+            self.future = pool.submit(run_render, target, args, kwargs, self._channel, self._cancel)
+        self.future.add_done_callback(self._finish)
+
+    @classmethod
+    def from_result(cls, result):
+        # a job already done, the model came from the artifact cache
+        job = cls.__new__(cls)
+        job._status = 'done'
+        job.result = result
+        job.error = None
+        job.submitted = job.started = job.finished = time.time()
+        job.cached = True
+        job._channel = None
+        job._cancel = None
+        job.future = None
+        return job
+
+    def _finish(self, future):
+        self.finished = time.time()
+        status = 'done'
+        if future.cancelled():
+            status = 'cancelled'
+        else:
+            try:
+                self.result = future.result()
+            except Cancelled:
+                status = 'cancelled'
+            except Exception as e:
+                self.error = f'{type(e).__name__}: {e}'
+                status = 'failed'
+            try:
+                self.started = self._channel.get('started')
+            except Exception:
+                pass
+        self._status = status
+        # the arguments (the outline) and the manager objects are not kept with the result
+        self.future = self._channel = self._cancel = None
+
+    def _state(self, name, default):
+        try:
+            return self._channel.get(name, default)
+        except Exception:  # the manager is gone, the server is shutting down
+            return default
+
+    @property
+    def status(self):
+        return self._status or self._state('status', 'queued')
+
+    @property
+    def progress(self):
+        return 1.0 if self._status else self._state('progress', 0.0)
+
+    @property
+    def message(self):
+        return '' if self._status else self._state('message', '')
+
+    def cancel(self):
+        if self.done():
+            return
+        self._cancel.set()
+        self.future.cancel()
+
+    def done(self):
+        return self._status is not None
+
+def clean_workspaces(max_age=24 * 3600, root=None):
+    # remove the workspaces left by processes that did not exit cleanly
+    root = root or workspace_root
+    for entry in os.scandir(root):
+        if entry.name.startswith('flexifier-') and entry.is_dir() and time.time() - entry.stat().st_mtime > max_age:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+def default_hinge(height, hinge_type='normal'):
+    return {'type': hinge_type, 'h_tran': [0.0, 0.0], 'h_rot': 0.0, 'h_break': 3.0, 'h_break_len': 100.0,
+            'h_diam': height, 'h_thick': 5.0, 'h_expose': True}
+
+def normalize_hinges(hinges, height):
+    # accepts a list or a dict of hinges, missing values take the defaults of the interface
+    if isinstance(hinges, dict):
+        hinges = [hinges[ind] for ind in sorted(hinges)]
+    normalized = dict()
+    for ind, h in enumerate(hinges, start=1):
+        normalized[ind] = default_hinge(height, h.get('type', 'normal'))
+        normalized[ind].update(h)
+        normalized[ind]['h_tran'] = [float(v) for v in normalized[ind]['h_tran']]
+        if normalized[ind].get('pattern'):
+            normalized[ind]['pattern'] = dict(default_pattern(normalized[ind]['pattern'].get('kind', 'line')), **normalized[ind]['pattern'])
+    return normalized
+
+pattern_kinds = ['line', 'axis', 'radial']
+
+def default_pattern(kind='line'):
+    # line: count hinges step mm apart, centered on h_tran, along the direction angle
+    # axis: count hinges evenly spaced along the longest axis of the outline, moved by h_tran
+    # radial: count hinges on a circle of radius mm around h_tran, the first one at angle
+    # the cut of every hinge is across the line (or the radius), rotated by h_rot
+    return {'kind': kind, 'count': 3, 'step': 20.0, 'angle': 0.0, 'radius': 30.0}
+
+def principal_axis(outline):
+    # center, direction (degrees) and extent along the direction of the longest axis of the
+    # outline, the points are the middles of the segments weighted by their length
+    points = np.concatenate(outline)
+    ends = np.concatenate([np.roll(c, -1, axis=0) for c in outline])
+    middles = (points + ends) / 2
+    weights = np.hypot(*(ends - points).T)
+    center = np.average(middles, axis=0, weights=weights)
+    values, vectors = np.linalg.eigh(np.cov((middles - center).T, aweights=weights))
+    axis = vectors[:, np.argmax(values)]
+    along = (points - center) @ axis
+    return center, degrees(atan2(axis[1], axis[0])), along.min(), along.max()
+
+def pattern_hinges(h, outline=None):
+    # the hinges of a pattern entry, a hinge without a pattern is returned as it is
+    pattern = h.get('pattern')
+    if not pattern:
+        return [h]
+    base = {key: value for key, value in h.items() if key != 'pattern'}
+    count = max(int(pattern['count']), 1)
+    tran = np.array(h['h_tran'], dtype=float)
+    if pattern['kind'] == 'radial':
+        angles = pattern['angle'] + np.arange(count) * 360 / count
+        places = [(tran + pattern['radius'] * np.array([cos(radians(a)), sin(radians(a))]), a) for a in angles]
+    else:
+        if pattern['kind'] == 'axis':
+            if not outline:
+                raise ValueError('an axis pattern needs the outline')
+            center, angle, low, high = principal_axis(outline)
+            offsets = low + (np.arange(count) + 1) * (high - low) / (count + 1)
+            start = center + tran
+        else:
+            angle = pattern['angle']
+            offsets = (np.arange(count) - (count - 1) / 2) * pattern['step']
+            start = tran
+        direction = np.array([cos(radians(angle)), sin(radians(angle))])
+        places = [(start + offset * direction, angle) for offset in offsets]
+    return [dict(base, h_tran=[float(x), float(y)], h_rot=float((angle + h['h_rot']) % 360)) for (x, y), angle in places]
+
+def expand_hinges(hinges, outline=None):
+    # hinges with the patterns replaced by their hinges, numbered from 1, and the entry of every
+    # hinge; the hinges of a pattern are the same shape moved, built once by the hinge cache
+    expanded = dict()
+    parents = dict()
+    for ind in sorted(hinges):
+        for h in pattern_hinges(hinges[ind], outline):
+            expanded[len(expanded) + 1] = h
+            parents[len(expanded)] = ind
+    return expanded, parents
+
+def hinge_names(parents):
+    # '3' for a single hinge, '3.2' for the second hinge of the pattern of entry 3
+    counts = Counter(parents.values())
+    seen = Counter()
+    names = dict()
+    for ind, parent in parents.items():
+        seen[parent] += 1
+        names[ind] = str(parent) if counts[parent] == 1 else f'{parent}.{seen[parent]}'
+    return names
+
+def image_outline(data, filetype):
+    # closed polylines of the image in mm, before the placement
+    if filetype == 'svg':
+        return svg_outline(data)
+    contours, size = trace(data)
+    return pixels_to_mm(contours, size)
+
+def input_pixels(data, filetype):
+    # pixels of the image, an svg has none
+    if filetype == 'svg':
+        return 0
+    width, height = image_size(data)
+    return width * height
+
+def model_faces(res):
+    # faces of the cadquery model, the size of the model that the booleans work on
+    return len(res.faces().vals())
+
+def prepare_outline(outline, scales, tran, rot, tolerance=0.0, min_area=0.0):
+    # placed outline, simplified when a tolerance (mm) or a minimum area (mm^2) is set,
+    # and the number of segments before and after the simplification
+    placed = place_outline(outline, scales, tran, rot)
+    simplified = simplify_outline(placed, tolerance, min_area) if tolerance > 0 or min_area > 0 else placed
+    return simplified, (outline_segments(placed), outline_segments(simplified))
+
+def placement_key(image_digest, filetype, scales, tran, rot):
+    # the image and its placement, the floats rounded so that equal placements compare equal
+    return (image_digest, filetype) + tuple(round(float(value), 6) for value in (*scales, *tran, rot))
+
+def trace_key(image_digest, filetype):
+    return artifact_key('trace', image_digest, filetype, flexifier_trace.threshold, flexifier_trace.max_pixels,
+                        flexifier_trace.turdsize, flexifier_outline.dpi, flexifier_outline.curve_segments,
+                        flexifier_outline.chord_tolerance)
+
+def trace_image(data, filetype):
+    # outline of the image and the svg of the openscad preview (the svg itself for an svg image),
+    # nothing is written in a workspace: the app writes the svg only for the openscad preview
+    key = trace_key(digest(data), filetype)
+    cached = artifact_cache.get(key) if artifact_cache else None
+    if cached is not None:
+        outline, svg = unpack_outline(cached)
+    elif filetype == 'svg':
+        outline, svg = svg_outline(data), data
+    else:
+        contours, size = trace(data)
+        outline = pixels_to_mm(contours, size)
+        svg = contours_to_svg(contours, size).encode()
+    if cached is None and artifact_cache:
+        artifact_cache.put(key, pack_outline(outline, svg))
+    return outline, svg
+
+def model_backend(backend, out):
+    # the mesh backend only writes stl and 3mf
+    return backend if out in mesh_formats else 'cadquery'
+
+def model_key(image_digest, filetype, scales, tran, rot, height, out, hinges, backend='cadquery', simplify=(0.0, 0.0),
+              tessellation=(linear_tolerance, angular_tolerance)):
+    # everything that changes the exported model, the hinge numbers only change the preview colours;
+    # the tessellation only changes the stl and 3mf of cadquery
+    backend = model_backend(backend, out)
+    tessellation = tessellation if backend == 'cadquery' and out in mesh_formats else None
+    return artifact_key('model', image_digest, filetype, scales, tran, rot, height, out, [hinges[ind] for ind in sorted(hinges)],
+                        backend, simplify, tessellation,
+                        hor_tolerance, vert_tolerance, chamfer_multi, flexifier_trace.threshold, flexifier_trace.max_pixels,
+                        flexifier_trace.turdsize, flexifier_outline.dpi, flexifier_outline.curve_segments,
+                        flexifier_outline.chord_tolerance)
+
+def export_model(res, out, tessellation=(linear_tolerance, angular_tolerance)):
+    # stl and 3mf are meshed with the (linear, angular) tessellation and written in memory,
+    # step is written by cadquery in a workspace
+    if out in mesh_formats:
+        return mesh_bytes(*shape_mesh(res.findSolid(), *tessellation), out)
+    with Workspace() as workspace:
+        path = workspace.file(f'file.{out}')
+        cq.exporters.export(res, path)
+        workspace.check()
+        with open(path, 'rb') as f:
+            return f.read()
+
+def render_session_model(session, key, build_base, hinges, render_mode, height, out, cache_key=None, stats=None,
+                         tessellation=(linear_tolerance, angular_tolerance), progress=no_progress):
+    # render of the app in a RenderSession; stats (a dict) receives the hinges, the faces of the
+    # model and the output bytes
+    res, timings = session.render(key, build_base, hinges, render_mode, height, progress)
+    progress(1, 1, 'export')
+    start = time.time()
+    model = export_model(res, out, tessellation)
+    timings['export'] = time.time() - start
+    if stats is not None:
+        stats.update(hinges=len(hinges), faces=model_faces(res), output_bytes=len(model))
+    if cache_key and artifact_cache:
+        artifact_cache.put(cache_key, model)
+    return model, timings
+
+def render_mesh_model(outline, hinges, height, cache_key=None, stats=None, out='stl', progress=no_progress):
+    # render of the app with the mesh backend, stl or 3mf; the faces in stats are the triangles
+    import flexifier_mesh  # imported here, flexifier_mesh imports this module
+    mesh, timings = flexifier_mesh.render_mesh(outline, hinges, height, progress)
+    progress(1, 1, 'export')
+    start = time.time()
+    model = mesh_bytes(*flexifier_mesh.mesh_arrays(mesh), out)
+    timings['export'] = time.time() - start
+    if stats is not None:
+        stats.update(hinges=len(hinges), faces=mesh.num_tri(), output_bytes=len(model))
+    if cache_key and artifact_cache:
+        artifact_cache.put(cache_key, model)
+    return model, timings
+
+def session_job(state, key, outline, hinges, render_mode, height, out, cache_key=None, stats=None,
+                tessellation=(linear_tolerance, angular_tolerance), keep=True, progress=no_progress):
+    # render_session_model in a render worker: the session comes in and goes out pickled (state,
+    # None for a new session), the stats come back with the model and the timings; with keep
+    # False the session is not sent back. The counters of the hinge cache are the worker's, the
+    # cache of the app process is not used
+    session = pickle.loads(state) if state else RenderSession()
+    stats = dict(stats or dict())
+    model, timings = render_session_model(session, key, lambda: extrude_outline(outline, height), hinges, render_mode,
+                                          height, out, cache_key, stats, tessellation, progress)
+    return model, timings, stats, pickle.dumps(session) if keep else None, hinge_cache.stats()
+
+def mesh_job(outline, hinges, height, cache_key=None, stats=None, out='stl', progress=no_progress):
+    # render_mesh_model in a render worker, returned like session_job without a session, with the
+    # counters of the hinge cache of the mesh backend
+    import flexifier_mesh
+    stats = dict(stats or dict())
+    model, timings = render_mesh_model(outline, hinges, height, cache_key, stats, out, progress)
+    return model, timings, stats, None, flexifier_mesh.mesh_hinge_cache.stats()
+
+def render(data, filetype, hinges, height=10.0, scales=(0.4, 0.4), tran=(0.0, 0.0), rot=0.0, out='stl', render_mode='batched',
+           backend='cadquery', tolerance=0.0, min_area=0.0, stats=None, check=True, tessellation=(linear_tolerance, angular_tolerance)):
+    # image or svg bytes in, model bytes out, timings of every step; stats (a dict) receives the
+    # sizes of flexifier_metrics (input bytes and pixels, segments of the outline before and after
+    # the simplification, hinges, faces of the model, output bytes) and the warnings of the check.
+    # tessellation is the (linear mm, angular radians) tolerance of the stl and 3mf of cadquery.
+    # With check the hinges are checked against the outline and a ValueError is raised if the
+    # render is known to fail
+    stats = stats if stats is not None else dict()
+    stats['input_bytes'] = len(data)
+    timings = dict()
+    hinges = normalize_hinges(hinges, height)
+    backend = model_backend(backend, out)
+    start = time.time()
+    key = model_key(digest(data), filetype, scales, tran, rot, height, out, hinges, backend, (tolerance, min_area), tessellation)
+    model = artifact_cache.get(key) if artifact_cache else None
+    timings['cache'] = time.time() - start
+    if model is not None:
+        stats['output_bytes'] = len(model)
+        return model, timings
+    start = time.time()
+    stats['input_pixels'] = input_pixels(data, filetype)
+    traced = image_outline(data, filetype)
+    timings['trace'] = time.time() - start
+    start = time.time()
+    outline, (stats['segments'], stats['simplified_segments']) = prepare_outline(traced, scales, tran, rot, tolerance, min_area)
+    if not outline:
+        raise ValueError('the image has no outline to extrude')
+    timings['outline'] = time.time() - start
+    hinges, parents = expand_hinges(hinges, outline)
+    stats['hinges'] = len(hinges)
+    if check:
+        import flexifier_check  # imported here, flexifier_check imports this module
+        start = time.time()
+        problems = flexifier_check.validate(outline, hinges, height, hinge_names(parents))
+        timings['check'] = time.time() - start
+        stats['warnings'] = [message for level, message in problems if level == 'warning']
+        if flexifier_check.errors(problems):
+            raise ValueError('; '.join(flexifier_check.errors(problems)))
+    if backend == 'mesh':
+        model, mesh_timings = render_mesh_model(outline, hinges, height, key, stats, out)
+        timings.update(mesh_timings)
+        return model, timings
+    start = time.time()
+    res = extrude_outline(outline, height)
+    timings['extrude'] = time.time() - start
+    res, hinge_timings = render_modes[render_mode](hinges, res, height)
+    timings.update(hinge_timings)
+    start = time.time()
+    model = export_model(res, out, tessellation)
+    timings['export'] = time.time() - start
+    stats.update(faces=model_faces(res), output_bytes=len(model))
+    if artifact_cache:
+        artifact_cache.put(key, model)
+    return model, timings
@@ -0,0 +1,170 @@
+# Render many models without the interface:
+#   python flexifier_batch.py images/ --out-dir models/ --hinges hinges.json --workers 4
+#   python flexifier_batch.py jobs.json --timeout 600 --metrics-log renders.jsonl --metrics flexifier.prom
+# A manifest is a json list (or one json object per line) of jobs like
+#   {"input": "dog.png", "output": "dog.stl", "height": 10, "scale": [0.4, 0.4], "translate": [0, 0],
+#    "rotate": 0, "out": "stl", "mode": "batched", "backend": "mesh", "simplify": 0.05, "min_area": 1,
+#    "tessellation": [0.1, 0.3],
+#    "hinges": [{"type": "normal", "h_tran": [10, 0]}]}
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import time
+from flexifier import render, backends, render_modes
+from flexifier_export import linear_tolerance, angular_tolerance
+from flexifier_metrics import record, render_record, write_text
+
+image_types = ('png', 'jpg', 'jpeg', 'svg')
+
+def load_jobs(source, defaults):
+    if os.path.isdir(source):
+        jobs = [dict(defaults, input=os.path.join(source, name)) for name in sorted(os.listdir(source))
+                if name.rsplit('.', 1)[-1].lower() in image_types]
+    else:
+        with open(source) as f:
+            text = f.read()
+        try:
+            jobs = json.loads(text)
+        except json.JSONDecodeError:
+            jobs = [json.loads(line) for line in text.splitlines() if line.strip()]
+        base = os.path.dirname(os.path.abspath(source))
+        jobs = [dict(defaults, **job) for job in jobs]
+        for job in jobs:
+            job['input'] = os.path.join(base, job['input'])
+            if 'output' in job:
+                job['output'] = os.path.join(base, job['output'])
+    for job in jobs:
+        name = os.path.splitext(os.path.basename(job['input']))[0]
+        job.setdefault('output', os.path.join(job['out_dir'], f"{name}.{job['out']}"))
+    return jobs
+
+def run_job(ind, job, results):
+    stats = dict()
+    try:
+        with open(job['input'], 'rb') as f:
+            data = f.read()
+        filetype = job['input'].rsplit('.', 1)[-1].lower()
+        model, timings = render(data, filetype, job['hinges'], height=job['height'], scales=job['scale'],
+                                tran=job['translate'], rot=job['rotate'], out=job['out'], render_mode=job['mode'],
+                                backend=job['backend'], tolerance=job['simplify'], min_area=job['min_area'], stats=stats,
+                                check=job['check'], tessellation=tuple(job['tessellation']))
+        with open(job['output'], 'wb') as f:
+            f.write(model)
+        results.put((ind, 'ok', len(model), timings, stats, ''))
+    except Exception as e:
+        results.put((ind, 'error', 0, dict(), stats, f'{type(e).__name__}: {e}'))
+
+def run_jobs(jobs, workers, timeout, metrics_log=None):
+    # one process per job, at most `workers` at the same time, killed after `timeout` seconds;
+    # every finished job is a record of flexifier_metrics, appended to metrics_log
+    results = multiprocessing.Queue()
+    pending = list(enumerate(jobs))
+    running = dict()
+    done = dict()
+    reported = set()
+    def collect(wait):
+        # read the results in the queue, waiting `wait` seconds for the first one; the late result
+        # of a job already over (killed for the timeout) is dropped, its record is already out
+        while True:
+            try:
+                ind, status, size, timings, stats, error = results.get(timeout=wait) if wait else results.get_nowait()
+            except queue.Empty:
+                return
+            wait = 0
+            if ind in done or ind not in running:
+                continue
+            done[ind] = {'status': status, 'bytes': size, 'timings': timings, 'stats': stats, 'error': error,
+                         'seconds': time.time() - running[ind][1]}
+    while pending or running:
+        while pending and len(running) < workers:
+            ind, job = pending.pop(0)
+            proc = multiprocessing.Process(target=run_job, args=(ind, job, results), daemon=True)
+            proc.start()
+            running[ind] = (proc, time.time())
+        collect(0.2)
+        for ind, (proc, start) in list(running.items()):
+            if ind not in done and not proc.is_alive():
+                # the result of a worker that just exited can still be on its way
+                collect(0)
+            if ind in done:
+                proc.join()
+                running.pop(ind)
+            elif time.time() - start > timeout:
+                proc.kill()
+                proc.join()
+                running.pop(ind)
+                done[ind] = {'status': 'timeout', 'bytes': 0, 'timings': dict(), 'stats': dict(), 'error': f'killed after {timeout} s', 'seconds': timeout}
+            elif not proc.is_alive():
+                running.pop(ind)
+                done[ind] = {'status': 'error', 'bytes': 0, 'timings': dict(), 'stats': dict(), 'error': f'worker exited with code {proc.exitcode}',
+                             'seconds': time.time() - start}
+        for ind in set(done) - reported:
+            reported.add(ind)
+            report = done[ind]
+            segments = ''
+            if 'segments' in report['stats']:
+                segments = f"({report['stats']['segments']} -> {report['stats']['simplified_segments']} segments) "
+            print(f"[{report['status']}] {jobs[ind]['input']} -> {jobs[ind]['output']} in {report['seconds']:.1f} s {segments}{report['error']}", flush=True)
+            job = jobs[ind]
+            record(render_record(report['seconds'], report['timings'], report['stats'], report['status'], input=job['input'],
+                                 backend=job['backend'], mode=job['mode'], out=job['out'], error=report['error']), metrics_log)
+    return [done[ind] for ind in range(len(jobs))]
+
+def summary(reports, wall):
+    count = dict()
+    for report in reports:
+        count[report['status']] = count.get(report['status'], 0) + 1
+    out_bytes = sum(report['bytes'] for report in reports)
+    busy = sum(report['seconds'] for report in reports)
+    lines = [f"{len(reports)} jobs in {wall:.1f} s: " + ', '.join(f'{n} {status}' for status, n in sorted(count.items())),
+             f"throughput {len(reports) / wall * 60 if wall else 0:.1f} jobs/min, {busy / max(len(reports), 1):.1f} s per job, {out_bytes / 1e6:.1f} MB written"]
+    return '\n'.join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render flexi models from a folder of images or a manifest of jobs')
+    parser.add_argument('source', help='folder of png/jpg/svg images or json manifest of jobs')
+    parser.add_argument('--out-dir', default='.', help='folder of the models when a job has no output')
+    parser.add_argument('--out', default='stl', choices=['stl', '3mf', 'step'])
+    parser.add_argument('--height', type=float, default=10.0)
+    parser.add_argument('--scale', type=float, nargs=2, default=[0.4, 0.4])
+    parser.add_argument('--hinges', help='json file with the list of hinges of the jobs without hinges')
+    parser.add_argument('--mode', default='batched', choices=list(render_modes),
+                        help='pieces builds the pieces one after the other here, the jobs already run in parallel')
+    parser.add_argument('--backend', default='cadquery', choices=backends, help='mesh is faster, only for stl')
+    parser.add_argument('--simplify', type=float, default=0.0, help='tolerance in mm of the outline simplification, 0 keeps every point')
+    parser.add_argument('--min-area', type=float, default=0.0, help='islands and holes smaller than this area in mm^2 are dropped')
+    parser.add_argument('--tessellation', type=float, nargs=2, default=[linear_tolerance, angular_tolerance], metavar=('MM', 'RADIANS'),
+                        help='linear and angular tolerance of the stl and 3mf triangles')
+    parser.add_argument('--no-check', action='store_true', help='render also the jobs whose hinges do not pass the check')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--timeout', type=float, default=900.0, help='seconds before a job is killed')
+    parser.add_argument('--report', help='write the result of every job to this json file')
+    parser.add_argument('--metrics-log', help='append the timings and sizes of every job to this json lines file')
+    parser.add_argument('--metrics', help='write the counters of the jobs to this file in the Prometheus text format')
+    args = parser.parse_args(argv)
+
+    hinges = list()
+    if args.hinges:
+        with open(args.hinges) as f:
+            hinges = json.load(f)
+    defaults = {'out_dir': args.out_dir, 'out': args.out, 'height': args.height, 'scale': args.scale,
+                'translate': [0.0, 0.0], 'rotate': 0.0, 'mode': args.mode, 'backend': args.backend,
+                'simplify': args.simplify, 'min_area': args.min_area, 'check': not args.no_check, 'tessellation': args.tessellation,
+                'hinges': hinges}
+    jobs = load_jobs(args.source, defaults)
+    os.makedirs(args.out_dir, exist_ok=True)
+    start = time.time()
+    reports = run_jobs(jobs, max(args.workers, 1), args.timeout, args.metrics_log)
+    print(summary(reports, time.time() - start))
+    if args.metrics:
+        write_text(args.metrics)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump([dict(job, **report) for job, report in zip(jobs, reports)], f, indent=2)
+    return 0 if all(report['status'] == 'ok' for report in reports) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
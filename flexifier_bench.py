@@ -0,0 +1,288 @@
+# Benchmark of the whole pipeline (trace, outline, extrude, hinges, export) on synthetic images:
+#   python flexifier_bench.py --out before.json
+#   python flexifier_bench.py --out after.json
+#   python flexifier_bench.py --compare before.json after.json
+# The images are drawn from a fixed seed, so two runs render the same models: simple shapes,
+# text cut in a plate, a detailed silhouette and a big noisy photo. Every image is rendered with
+# 1..N hinges spread along its longest axis, for the normal hinge and the ball joint with and
+# without h_expose; every hinge is moved along the axis, then across it, to the nearest place that
+# passes the checks of flexifier_check (the letters of the text are holes), a case without such a
+# place is skipped and reported, a render that fails is recorded as an error. The time of a case
+# is the best of --repeat runs with cold hinge caches, the memory is the peak resident size
+# (VmHWM or ru_maxrss, OCC included) of one more run in a new process.
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from importlib.metadata import version, PackageNotFoundError
+from io import BytesIO
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+import flexifier
+from flexifier import render, backends, render_modes, hinge_cache, default_hinge, image_outline, prepare_outline, principal_axis
+from flexifier_check import errors, validate
+from flexifier_outline import units
+
+seed = 1234
+hinge_spacing = 30.0  # mm between the hinges at the biggest hinge count
+# the models are sized for at least this many hinges: with fewer, the text plate has no room for a
+# hinge above or below the letters
+model_hinges = 8
+hinge_search = 2.0  # mm between the places tried for a hinge that fails the checks
+variants = {'normal': ('normal', True), 'ball-exposed': ('ball', True), 'ball-hidden': ('ball', False)}
+
+def png_bytes(image):
+    out = BytesIO()
+    image.save(out, 'png')
+    return out.getvalue()
+
+def shapes_image(width):
+    # a bar with round ends and two round ears: few long segments
+    height = width // 4
+    image = Image.new('L', (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    draw.rounded_rectangle((width * 0.05, height * 0.25, width * 0.95, height * 0.75), radius=height * 0.25, fill=0)
+    for x in (0.1, 0.9):
+        draw.ellipse((width * x - height * 0.4, height * 0.1, width * x + height * 0.4, height * 0.9), fill=0)
+    return png_bytes(image)
+
+def text_image(width):
+    # a plate with the letters cut out: many curved holes
+    height = width // 4
+    image = Image.new('L', (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    draw.rounded_rectangle((width * 0.02, height * 0.05, width * 0.98, height * 0.95), radius=height * 0.2, fill=0)
+    font = ImageFont.load_default(size=int(height * 0.5))
+    draw.text((width / 2, height / 2), 'FLEXIFIER 0123', fill=255, font=font, anchor='mm')
+    return png_bytes(image)
+
+def silhouette_image(width):
+    # a long blob with a border made of hundreds of harmonics: every pixel of the border is a corner
+    rng = np.random.default_rng(seed)
+    height = width // 4
+    angles = np.linspace(0, 2 * np.pi, 8000, endpoint=False)
+    harmonics = np.arange(2, 400)
+    amplitudes = rng.normal(0, 1, len(harmonics)) * 0.08 / harmonics
+    phases = rng.uniform(0, 2 * np.pi, len(harmonics))
+    radius = 1 + np.cos(np.outer(angles, harmonics) + phases) @ amplitudes
+    points = np.c_[width / 2 + np.cos(angles) * radius * width * 0.4, height / 2 + np.sin(angles) * radius * height * 0.35]
+    image = Image.new('L', (width, height), 255)
+    ImageDraw.Draw(image).polygon([tuple(p) for p in points], fill=0)
+    return png_bytes(image)
+
+def photo_image(width):
+    # a dark subject on a light background with gaussian noise, like a photo: speckles and
+    # ragged borders, bigger than flexifier_trace.max_pixels so it is also downsampled
+    rng = np.random.default_rng(seed)
+    height = width // 4
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    subject = ((x - width / 2) / (width * 0.42)) ** 2 + ((y - height / 2) / (height * 0.4)) ** 2
+    grey = 60 + 160 / (1 + np.exp(-(subject - 1) * 12)) + rng.normal(0, 25, (height, width)).astype(np.float32)
+    return png_bytes(Image.fromarray(np.clip(grey, 0, 255).astype(np.uint8)))
+
+inputs = {'shapes': (shapes_image, 2000), 'text': (text_image, 2400), 'silhouette': (silhouette_image, 3000),
+          'photo': (photo_image, 5000)}
+
+def versions():
+    found = {'python': platform.python_version()}
+    for package in ('cadquery', 'numpy', 'pillow', 'manifold3d'):
+        try:
+            found[package] = version(package)
+        except PackageNotFoundError:
+            pass
+    return found
+
+class NoPlacement(ValueError):
+    pass
+
+def case_hinges(outline, kind, expose, count, length, height):
+    # count hinges evenly spaced on the longest axis, with cuts long enough to go through the
+    # model; a hinge failing the checks goes to the nearest place that passes them, within half
+    # the spacing along the axis and 40% of the cut length across it (along its cut, the text has
+    # room for the hinges only above or below the letters), ValueError if there is none
+    center, angle, low, high = principal_axis(outline)
+    along = np.array([np.cos(np.radians(angle)), np.sin(np.radians(angle))])
+    across = np.array([-along[1], along[0]])
+    spacing = (high - low) / (count + 1)
+    places = [(a, b) for b in sorted(np.arange(-0.4, 0.41, 0.05) * length, key=abs)
+              for a in sorted(np.arange(-spacing / 2, spacing / 2, hinge_search), key=abs)]
+    hinges = dict()
+    for ind in range(1, count + 1):
+        for shift, side in places:
+            tran = center + (low + ind * spacing + shift) * along + side * across
+            h = dict(default_hinge(height, kind), h_expose=expose, h_break_len=length * 2, h_rot=float(angle),
+                     h_tran=[float(tran[0]), float(tran[1])])
+            if not errors(validate(outline, {**hinges, ind: h}, height)):
+                hinges[ind] = h
+                break
+        else:
+            raise NoPlacement(f'no place for hinge {ind} that passes the checks')
+    return [hinges[ind] for ind in sorted(hinges)]
+
+def clear_caches(backend):
+    hinge_cache.clear()
+    if backend == 'mesh':
+        import flexifier_mesh
+        flexifier_mesh.mesh_hinge_cache.clear()
+
+def max_resident():
+    # peak resident size of this process in bytes: VmHWM on linux, where ru_maxrss keeps the value
+    # of the parent process across exec, ru_maxrss elsewhere (in bytes on macOS, in KB elsewhere)
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+def peak_memory(data, hinges, options):
+    # runs in a new process: resident size after the imports and peak resident size of a render
+    flexifier.artifact_cache = None
+    before = max_resident()
+    render(data, 'png', hinges, **options)
+    return before, max_resident()
+
+def run_case(data, hinges, scale, args):
+    # best time of args.repeat renders and the peak memory of one more render
+    options = dict(height=args.height, scales=(scale, scale), out=args.format, render_mode=args.mode,
+                   backend=args.backend, tolerance=args.simplify, check=True)
+    best = None
+    for _ in range(args.repeat):
+        clear_caches(args.backend)
+        stats = dict()
+        start = time.perf_counter()
+        model, timings = render(data, 'png', hinges, stats=stats, **options)
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best[0]:
+            best = (seconds, timings, stats)
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        base, peak = pool.submit(peak_memory, data, hinges, options).result()
+    seconds, timings, stats = best
+    stats.pop('warnings', None)
+    return dict(stats, seconds=seconds, stages=timings, peak_bytes=peak, base_bytes=base)
+
+def run(args):
+    # the artifact cache would return the models of the previous run
+    flexifier.artifact_cache = None
+    counts = sorted(set(args.hinges))
+    cases = list()
+    settings = {key: getattr(args, key) for key in ('inputs', 'hinges', 'types', 'mode', 'backend', 'format', 'height',
+                                                    'simplify', 'repeat', 'quick')}
+    total = len(args.inputs) * len(counts) * len(args.types)
+    for name in args.inputs:
+        draw, width = inputs[name]
+        width = width // 4 if args.quick else width
+        data = draw(width)
+        # the same model for all the hinge counts, long enough for the biggest count
+        scale = hinge_spacing * (max(counts[-1], model_hinges) + 1) / (width * units['pt'])
+        length = width // 4 * units['pt'] * scale
+        outline = prepare_outline(image_outline(data, 'png'), (scale, scale), (0.0, 0.0), 0.0, args.simplify)[0]
+        for count in counts:
+            for variant in args.types:
+                kind, expose = variants[variant]
+                case = {'name': f'{name}/{variant}/{count}', 'input': name, 'width': width, 'type': kind,
+                        'h_expose': expose, 'count': count}
+                try:
+                    hinges = case_hinges(outline, kind, expose, count, length, args.height)
+                except NoPlacement as e:
+                    # reported, not a failure of the render
+                    case['skipped'] = str(e)
+                    cases.append(case)
+                    print(f"[{len(cases)}/{total}] {case['name']}: skipped, {e}", flush=True)
+                    continue
+                try:
+                    case.update(run_case(data, hinges, scale, args))
+                    line = f"{case['seconds']:.2f} s, peak {case['peak_bytes'] / 2**20:.0f} MB, {case.get('faces', 0)} faces"
+                except Exception as e:
+                    case['error'] = f'{type(e).__name__}: {e}'
+                    line = case['error']
+                cases.append(case)
+                print(f"[{len(cases)}/{total}] {case['name']}: {line}", flush=True)
+    return {'label': args.label, 'time': time.time(), 'platform': platform.platform(), 'versions': versions(),
+            'settings': settings, 'cases': cases}
+
+def changes(old, new, threshold, min_seconds, min_bytes):
+    # lines of the comparison and the number of regressions: a case or a stage is slower (or
+    # uses more memory) by more than threshold and by more than the noise floor
+    lines = list()
+    regressions = 0
+    old_cases = {case['name']: case for case in old['cases']}
+    for case in new['cases']:
+        before = old_cases.get(case['name'])
+        if 'skipped' in case or (before is not None and 'skipped' in before):
+            lines.append(f"{case['name']:32} skipped: {case.get('skipped') or before['skipped']}")
+            continue
+        if before is None or 'error' in case or 'error' in before:
+            # a case that fails now and did not before is a regression
+            broken = before is not None and 'error' in case and 'error' not in before
+            regressions += broken
+            status = 'new case' if before is None else case.get('error') or f"was {before['error']}"
+            lines.append(f"{case['name']:32} {status}" + ('  REGRESSION' if broken else ''))
+            continue
+        checks = [('total', before['seconds'], case['seconds'], min_seconds)]
+        checks += [(stage, before['stages'].get(stage, 0.0), seconds, min_seconds) for stage, seconds in case['stages'].items()]
+        checks.append(('peak memory', before['peak_bytes'], case['peak_bytes'], min_bytes))
+        flagged = [(what, a, b) for what, a, b, floor in checks if b > a * (1 + threshold) and b - a > floor]
+        regressions += len(flagged)
+        change = case['seconds'] / before['seconds'] - 1 if before['seconds'] else 0.0
+        lines.append(f"{case['name']:32} {before['seconds']:8.2f} s {case['seconds']:8.2f} s {change:+7.1%}" +
+                     ('  REGRESSION' if flagged else ''))
+        for what, a, b in flagged:
+            unit, a, b = ('MB', a / 2**20, b / 2**20) if what == 'peak memory' else ('s', a, b)
+            lines.append(f"    {what}: {a:.2f} {unit} -> {b:.2f} {unit}")
+    return lines, regressions
+
+def compare(old_path, new_path, threshold, min_seconds, min_bytes):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    if old['settings'] != new['settings']:
+        print('warning: the two runs have different settings, the cases may not be comparable')
+    if old['versions'] != new['versions']:
+        print(f"versions: {old['versions']} -> {new['versions']}")
+    lines, regressions = changes(old, new, threshold, min_seconds, min_bytes)
+    print(f"{'case':32} {old['label'] or old_path:>10} {new['label'] or new_path:>10}")
+    print('\n'.join(lines))
+    print(f'{regressions} regressions (more than {threshold:.0%} and {min_seconds} s or {min_bytes / 2**20:.0f} MB slower or bigger)')
+    return 1 if regressions else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the render on synthetic images, or compare two benchmark runs')
+    parser.add_argument('--out', default='bench.json', help='json file of the results')
+    parser.add_argument('--label', default='', help='name of the run in the comparison')
+    parser.add_argument('--inputs', nargs='+', default=list(inputs), choices=list(inputs))
+    parser.add_argument('--hinges', type=int, nargs='+', default=[1, 4, 8], help='hinge counts of every image')
+    parser.add_argument('--types', nargs='+', default=list(variants), choices=list(variants))
+    parser.add_argument('--mode', default='batched', choices=list(render_modes))
+    parser.add_argument('--backend', default='cadquery', choices=backends)
+    parser.add_argument('--format', default='stl', choices=['stl', '3mf', 'step'])
+    parser.add_argument('--height', type=float, default=10.0)
+    parser.add_argument('--simplify', type=float, default=0.0, help='tolerance in mm of the outline simplification')
+    parser.add_argument('--repeat', type=int, default=1, help='renders of every case, the best time is kept')
+    parser.add_argument('--quick', action='store_true', help='images 4 times smaller, for a fast check')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files instead of running')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative slowdown flagged as a regression')
+    parser.add_argument('--min-seconds', type=float, default=0.05, help='slowdowns smaller than this are noise')
+    parser.add_argument('--min-mb', type=float, default=1.0, help='memory growths smaller than this are noise')
+    args = parser.parse_args(argv)
+    if args.compare:
+        return compare(*args.compare, args.threshold, args.min_seconds, args.min_mb * 2**20)
+    args.repeat = max(args.repeat, 1)
+    result = run(args)
+    with open(args.out, 'w') as f:
+        json.dump(result, f, indent=2)
+    failed = sum('error' in case for case in result['cases'])
+    skipped = sum('skipped' in case for case in result['cases'])
+    print(f"{len(result['cases'])} cases written to {args.out}" + (f', {failed} failed' if failed else '') +
+          (f', {skipped} skipped' if skipped else ''))
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,158 @@
+# Content addressed cache of the traced outlines, previews and exported models on disk.
+# The key is a hash of everything that changes the artifact, so the same logo uploaded again
+# or the same hinges rendered again are read from disk. The least recently used files are
+# removed when the cache is bigger than max_bytes. Several processes can share the folder.
+# memory_store keeps the outlines, the rendered models and the render sessions in use in memory,
+# out of the streamlit sessions.
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from io import BytesIO
+import numpy as np
+
+cache_dir = os.environ.get('FLEXIFIER_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'flexifier')
+cache_size = int(os.environ.get('FLEXIFIER_CACHE_SIZE', 2**30))  # bytes, 0 disables the cache
+
+def digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+def _normal(value):
+    # floats rounded so that 10 and 10.0000000001 give the same key
+    if isinstance(value, dict):
+        return {str(k): _normal(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normal(v) for v in value]
+    if isinstance(value, (float, np.floating)):
+        return round(float(value), 6)
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+def artifact_key(kind, *parts):
+    text = json.dumps([kind, _normal(list(parts))], sort_keys=True)
+    return f'{kind}-{digest(text.encode())}'
+
+class ArtifactCache:
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self.size = sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+    def file(self, key):
+        return os.path.join(self.path, key)
+
+    def get(self, key):
+        try:
+            with open(self.file(key), 'rb') as f:
+                data = f.read()
+            # the modification time is the last use of the file
+            os.utime(self.file(key))
+        except OSError:
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        old = os.path.getsize(self.file(key)) if os.path.exists(self.file(key)) else 0
+        fd, tmp = tempfile.mkstemp(dir=self.path, prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, self.file(key))
+        with self.lock:
+            self.size += len(data) - old
+            if self.size > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        # scan the folder, other processes may have added or removed files
+        entries = [entry for entry in os.scandir(self.path) if entry.is_file() and not entry.name.startswith('.tmp-')]
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        self.size = sum(entry.stat().st_size for entry in entries)
+        while entries and self.size > self.max_bytes * 0.9:
+            entry = entries.pop(0)
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                self.size -= size
+            except OSError:
+                pass
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else 0.0,
+                'bytes': self.size, 'max_bytes': self.max_bytes}
+
+class MemoryStore:
+    # LRU store of big objects in memory (the traced outlines, the models), shared by all the
+    # sessions of the server: a session keeps only the key, the least recently used objects are
+    # dropped when the sizes passed to put() add up to more than max_bytes
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.items = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.items:
+                self.misses += 1
+                return None
+            self.items.move_to_end(key)
+            self.hits += 1
+            return self.items[key][0]
+
+    def put(self, key, value, size):
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.items:
+                self.size -= self.items.pop(key)[1]
+            self.items[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                self.size -= self.items.popitem(last=False)[1][1]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'entries': len(self.items), 'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else 0.0,
+                'bytes': self.size, 'max_bytes': self.max_bytes}
+
+memory_store = MemoryStore(int(os.environ.get('FLEXIFIER_MEMORY_STORE_SIZE', 256 * 2**20)))
+
+def outline_nbytes(outline):
+    return sum(ring.nbytes for ring in outline)
+
+def pack_outline(outline, svg):
+    buffer = BytesIO()
+    np.savez(buffer, svg=np.frombuffer(svg, dtype=np.uint8), *outline)
+    return buffer.getvalue()
+
+def unpack_outline(data):
+    arrays = np.load(BytesIO(data))
+    outline = [arrays[f'arr_{i}'] for i in range(len(arrays.files) - 1)]
+    return outline, arrays['svg'].tobytes()
+
+def open_cache():
+    if cache_size <= 0:
+        return None
+    try:
+        return ArtifactCache(cache_dir, cache_size)
+    except OSError as e:
+        print('artifact cache disabled:', e)
+        return None
+
+artifact_cache = open_cache()
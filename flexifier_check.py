@@ -0,0 +1,200 @@
+# Checks of the hinges against the placed outline before a render, in 2D and in a few ms:
+# hinges overlapping each other, cuts that miss the outline or do not separate the part and
+# hinges without enough material around them. The outline segments and the hinges are kept
+# in a grid of boxes so that every test only looks at the segments near the hinge.
+from math import sqrt
+import numpy as np
+from flexifier import hor_tolerance, vert_tolerance, chamfer_multi
+from flexifier_preview import place
+
+min_wall = 1.0  # mm of material wanted around the parts of a hinge
+
+class BoxGrid:
+    # uniform grid of axis aligned boxes (xmin, ymin, xmax, ymax), query() returns the
+    # numbers of the boxes touching a box
+    def __init__(self, boxes, cell=None):
+        self.boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+        count = len(self.boxes)
+        self.origin = self.boxes[:, :2].min(axis=0) if count else np.zeros(2)
+        self.top = self.boxes[:, 2:].max(axis=0) if count else np.zeros(2)
+        span = (self.top - self.origin).max() if count else 1.0
+        self.cell = cell or max(span / max(sqrt(count), 1.0), 1e-6)
+        low, high = self.cells(self.boxes)
+        self.rows = int(high[:, 1].max()) + 1 if count else 1
+        sizes = (high - low + 1).prod(axis=1)
+        ids = np.repeat(np.arange(count), sizes)
+        # position of every entry inside the cells of its box
+        local = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        heights = (high - low + 1)[ids, 1]
+        keys = (low[ids, 0] + local // heights) * self.rows + low[ids, 1] + local % heights
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.ids = ids[order]
+
+    def cells(self, boxes):
+        low = np.floor((boxes[:, :2] - self.origin) / self.cell).astype(np.int64)
+        high = np.floor((boxes[:, 2:] - self.origin) / self.cell).astype(np.int64)
+        return np.maximum(low, 0), np.maximum(high, 0)
+
+    def query(self, box):
+        if not len(self.boxes):
+            return np.zeros(0, dtype=np.int64)
+        # the box is clipped to the grid, it can be infinite (a ray)
+        clipped = np.r_[np.clip(box[:2], self.origin, self.top), np.clip(box[2:], self.origin, self.top)]
+        low, high = self.cells(clipped.reshape(1, 4))
+        high = high[0]
+        cols, rows = np.meshgrid(np.arange(low[0, 0], high[0] + 1), np.arange(low[0, 1], high[1] + 1), indexing='ij')
+        keys = (cols * self.rows + rows).ravel()
+        starts = np.searchsorted(self.keys, keys)
+        ends = np.searchsorted(self.keys, keys, side='right')
+        lengths = ends - starts
+        found = np.unique(self.ids[np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())])
+        boxes = self.boxes[found]
+        return found[(boxes[:, 0] <= box[2]) & (box[0] <= boxes[:, 2]) & (boxes[:, 1] <= box[3]) & (box[1] <= boxes[:, 3])]
+
+class OutlineIndex:
+    # the segments of the outline in a BoxGrid
+    def __init__(self, outline):
+        rings = [c for c in outline if len(c) > 2]
+        self.starts = np.concatenate(rings) if rings else np.zeros((0, 2))
+        # the last point of every ring goes back to the first one
+        following = np.arange(1, len(self.starts) + 1)
+        sizes = np.array([len(c) for c in rings], dtype=np.int64)
+        following[np.cumsum(sizes) - 1] = np.cumsum(sizes) - sizes
+        self.ends = self.starts[following]
+        self.grid = BoxGrid(np.c_[np.minimum(self.starts, self.ends), np.maximum(self.starts, self.ends)])
+
+    def near(self, box):
+        found = self.grid.query(box)
+        return self.starts[found], self.ends[found]
+
+    def crosses(self, a, b):
+        # the segment a-b touches the outline
+        starts, ends = self.near((*np.minimum(a, b), *np.maximum(a, b)))
+        return bool(segments_cross(a, b, starts, ends).any())
+
+    def inside(self, point):
+        # the point is in the material: it is inside an odd number of rings
+        x, y = point
+        starts, ends = self.near((x, y, np.inf, y))
+        crossing = (starts[:, 1] > y) != (ends[:, 1] > y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_cross = starts[:, 0] + (y - starts[:, 1]) * (ends[:, 0] - starts[:, 0]) / (ends[:, 1] - starts[:, 1])
+        return np.count_nonzero(crossing & (x < x_cross)) % 2 == 1
+
+    def clear(self, corners):
+        # no segment of the outline crosses the rectangle or lies inside it
+        box = (*corners.min(axis=0), *corners.max(axis=0))
+        starts, ends = self.near(box)
+        if not len(starts):
+            return True
+        for a, b in zip(corners, np.roll(corners, -1, axis=0)):
+            if segments_cross(a, b, starts, ends).any():
+                return False
+        return not in_rectangle(starts, corners).any()
+
+def cross(o, a, b):
+    return (a[..., 0] - o[..., 0]) * (b[..., 1] - o[..., 1]) - (a[..., 1] - o[..., 1]) * (b[..., 0] - o[..., 0])
+
+def segments_cross(a, b, starts, ends):
+    # the segment a-b crosses or touches every segment starts-ends
+    d1, d2 = cross(starts, ends, a), cross(starts, ends, b)
+    d3, d4 = cross(a, b, starts), cross(a, b, ends)
+    return (d1 * d2 <= 0) & (d3 * d4 <= 0)
+
+def in_rectangle(points, corners):
+    # corners in counterclockwise order
+    edges = [cross(a, b, points) for a, b in zip(corners, np.roll(corners, -1, axis=0))]
+    return np.all(np.array(edges) >= 0, axis=0)
+
+def rectangle(x0, y0, x1, y1):
+    return np.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1]], dtype=float)
+
+def rectangles_overlap(a, b):
+    # separating axis test of two convex polygons
+    for poly in (a, b):
+        for p, q in zip(poly, np.roll(poly, -1, axis=0)):
+            axis = np.array([p[1] - q[1], q[0] - p[0]])
+            pa, pb = a @ axis, b @ axis
+            if pa.max() < pb.min() or pb.max() < pa.min():
+                return False
+    return True
+
+def hinge_shapes(h):
+    # cut (slot) and region of the parts of a hinge in the local frame, the region is the
+    # rectangle around the hole, the pin, the ring and the balls
+    b, d = h['h_break'], h['h_diam']
+    chamfer = b * chamfer_multi * sqrt(2) / 2  # the chamfers are wider than the cut
+    slot = rectangle(-max(b / 2, chamfer), -h['h_break_len'] / 2, max(b / 2, chamfer), h['h_break_len'] / 2)
+    if h['type'] == 'normal':
+        pin_diam = (d - vert_tolerance) / 3
+        x_hinge = -b / 2 - pin_diam / 2
+        hole_x = (d + pin_diam) / 2 + hor_tolerance
+        half = h['h_thick'] / 2 + hor_tolerance
+        region = rectangle(min(-b / 2 - hole_x, x_hinge - d / 2), -half, x_hinge + hole_x / 2 + b * chamfer_multi * sqrt(2), half)
+    else:
+        hole = (d + vert_tolerance) / 2
+        x_ball = b / 2 + hole
+        half = max(hole, (d / 2 + hor_tolerance) / 2 if h['h_expose'] else d / 4 + hor_tolerance)
+        region = rectangle(-x_ball - hole, -half, x_ball + hole, half)
+    return slot, region
+
+def grow(corners, margin):
+    # the rectangle bigger by margin on every side
+    u = (corners[1] - corners[0]) / np.linalg.norm(corners[1] - corners[0]) * margin
+    v = (corners[3] - corners[0]) / np.linalg.norm(corners[3] - corners[0]) * margin
+    return np.array([corners[0] - u - v, corners[1] + u - v, corners[2] + u + v, corners[3] - u + v])
+
+def validate(outline, hinges, height, names=None):
+    # list of (level, message), a render with an 'error' is known to fail or to come out broken;
+    # names are the numbers of the hinges in the messages, the keys of hinges by default
+    names = names or {ind: ind for ind in hinges}
+    problems = list()
+    if not outline:
+        return [('error', 'the image has no outline to extrude')]
+    for ind, h in hinges.items():
+        if min(h['h_break'], h['h_break_len'], h['h_diam']) <= 0 or (h['type'] == 'normal' and h['h_thick'] <= 0):
+            problems.append(('error', f'hinge {names[ind]}: the sizes must be positive'))
+        elif h['type'] == 'normal' and h['h_diam'] <= vert_tolerance:
+            problems.append(('error', f'hinge {names[ind]}: the diameter must be bigger than the tolerance ({vert_tolerance} mm)'))
+        elif h['h_diam'] > height:
+            problems.append(('error', f'hinge {names[ind]}: the diameter ({h["h_diam"]:.1f} mm) is bigger than the model height ({height:.1f} mm)'))
+    if problems:
+        return problems
+    index = OutlineIndex(outline)
+    shapes = {ind: [place(shape, h) for shape in hinge_shapes(h)] for ind, h in hinges.items()}
+    slots = {ind: slot for ind, (slot, _) in shapes.items()}
+    regions = {ind: region for ind, (_, region) in shapes.items()}
+    # hinges: a cut or the parts of a hinge over the parts of another hinge, two cuts can cross
+    order = list(hinges)
+    footprints = BoxGrid([(*np.r_[slots[ind], regions[ind]].min(axis=0), *np.r_[slots[ind], regions[ind]].max(axis=0)) for ind in order])
+    for pos, ind in enumerate(order):
+        for other in footprints.query((*np.r_[slots[ind], regions[ind]].min(axis=0), *np.r_[slots[ind], regions[ind]].max(axis=0))):
+            other = order[other]
+            if other <= ind:
+                continue
+            if (rectangles_overlap(regions[ind], regions[other]) or rectangles_overlap(slots[ind], regions[other]) or
+                    rectangles_overlap(regions[ind], slots[other])):
+                problems.append(('error', f'hinge {names[ind]} and hinge {names[other]} overlap'))
+    for ind, h in hinges.items():
+        slot = slots[ind]
+        ends = [(slot[0], slot[1]), (slot[2], slot[3])]
+        middle = [(slot[0] + slot[1]) / 2, (slot[2] + slot[3]) / 2]
+        if not index.crosses(*middle) and not index.inside(middle[0]):
+            problems.append(('error', f'the cut of hinge {names[ind]} misses the outline'))
+            continue
+        # the ends of the cut must be out of the material or in the cut of another hinge
+        for (a, b) in ends:
+            in_cut = any(in_rectangle(np.array([a, b]), slots[other]).all() for other in hinges if other != ind)
+            if not in_cut and (index.crosses(a, b) or index.inside((a + b) / 2)):
+                problems.append(('error', f'the cut of hinge {names[ind]} does not separate the part, make it longer or move it'))
+                break
+        region = regions[ind]
+        if not index.inside(region.mean(axis=0)) or not index.clear(region):
+            problems.append(('error', f'hinge {names[ind]} is out of the model: not enough material for the diameter and the thickness'))
+        elif not index.clear(grow(region, min_wall)):
+            problems.append(('warning', f'hinge {names[ind]} has less than {min_wall} mm of material around it'))
+    return problems
+
+def errors(problems):
+    return [message for level, message in problems if level == 'error']
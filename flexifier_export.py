@@ -0,0 +1,104 @@
+# Export of the models in memory, without a file on disk: the cadquery model is meshed with an
+# absolute linear (mm) and angular (radians) tolerance and the triangles are written as binary
+# stl or as 3mf (a zip of xml, much smaller than the stl). The mesh backend writes its triangles
+# with the same functions. The step output is written by cadquery in a file of the workspace.
+import zipfile
+from io import BytesIO, TextIOWrapper
+import numpy as np
+from OCP.BRep import BRep_Tool
+from OCP.BRepBuilderAPI import BRepBuilderAPI_Copy
+from OCP.BRepMesh import BRepMesh_IncrementalMesh
+from OCP.TopAbs import TopAbs_FACE, TopAbs_REVERSED
+from OCP.TopExp import TopExp_Explorer
+from OCP.TopLoc import TopLoc_Location
+from OCP.TopoDS import TopoDS
+
+linear_tolerance = 0.1  # mm between the surface of the model and the triangles
+angular_tolerance = 0.3  # radians between the sides of a curve, about 21 sides for a circle
+mesh_formats = ['stl', '3mf']
+
+def shape_mesh(shape, tolerance=linear_tolerance, angular=angular_tolerance):
+    # vertices (n, 3) and triangles (m, 3) of a cadquery shape, the faces are meshed in parallel
+    # and read without the Vector objects of Shape.tessellate. The shape shares its faces with the
+    # cached hinges (moved parts) and with the other renders: a private copy of the topology (the
+    # surfaces are shared, only read) is meshed, without a mesh of another export on its faces
+    # and without touching the triangulation that another thread reads
+    copy = BRepBuilderAPI_Copy(shape.wrapped, False, False).Shape()
+    BRepMesh_IncrementalMesh(copy, tolerance, False, angular, True)
+    vertices, triangles = list(), list()
+    offset = 0
+    explorer = TopExp_Explorer(copy, TopAbs_FACE)
+    while explorer.More():
+        face = TopoDS.Face_s(explorer.Current())
+        explorer.Next()
+        location = TopLoc_Location()
+        poly = BRep_Tool.Triangulation_s(face, location)
+        if poly is None:
+            continue
+        points = np.array([poly.Node(i).Coord() for i in range(1, poly.NbNodes() + 1)])
+        if not location.IsIdentity():
+            trsf = location.Transformation()
+            matrix = np.array([[trsf.Value(row, col) for col in range(1, 5)] for row in range(1, 4)])
+            points = points @ matrix[:, :3].T + matrix[:, 3]
+        corners = np.array([poly.Triangle(i).Get() for i in range(1, poly.NbTriangles() + 1)]) - 1 + offset
+        if face.Orientation() == TopAbs_REVERSED:
+            corners = corners[:, [0, 2, 1]]
+        vertices.append(points)
+        triangles.append(corners)
+        offset += len(points)
+    if not vertices:
+        return np.zeros((0, 3)), np.zeros((0, 3), dtype=np.int64)
+    return np.concatenate(vertices), np.concatenate(triangles)
+
+def merge_vertices(vertices, triangles, digits=6):
+    # the faces share the points of their edges: one vertex for each point, no flat triangles
+    unique, inverse = np.unique(np.round(vertices, digits), axis=0, return_inverse=True)
+    triangles = inverse.reshape(-1)[triangles]
+    flat = (triangles[:, 0] == triangles[:, 1]) | (triangles[:, 1] == triangles[:, 2]) | (triangles[:, 0] == triangles[:, 2])
+    return unique, triangles[~flat]
+
+def stl_bytes(vertices, triangles):
+    # binary stl of the triangles
+    corners = np.asarray(vertices, dtype=np.float32)[triangles]
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals = np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+    records = np.zeros(len(corners), dtype=[('normal', '<f4', 3), ('points', '<f4', (3, 3)), ('attribute', '<u2')])
+    records['normal'] = normals
+    records['points'] = corners
+    header = b'flexifier'.ljust(80, b' ')
+    return header + np.uint32(len(corners)).tobytes() + records.tobytes()
+
+content_types = '''<?xml version="1.0" encoding="UTF-8"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="model" ContentType="application/vnd.ms-package.3dmanufacturing-3dmodel+xml"/>
+</Types>
+'''
+relationships = '''<?xml version="1.0" encoding="UTF-8"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Target="/3D/3dmodel.model" Id="rel0" Type="http://schemas.microsoft.com/3dmanufacturing/2013/01/3dmodel"/>
+</Relationships>
+'''
+
+def threemf_bytes(vertices, triangles):
+    # 3mf package of the mesh, the xml of the model is streamed in the zip
+    vertices, triangles = merge_vertices(vertices, triangles)
+    out = BytesIO()
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as package:
+        package.writestr('[Content_Types].xml', content_types)
+        package.writestr('_rels/.rels', relationships)
+        with package.open('3D/3dmodel.model', 'w') as entry, TextIOWrapper(entry, encoding='utf-8') as model:
+            model.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                        '<model unit="millimeter" xml:lang="en-US" xmlns="http://schemas.microsoft.com/3dmanufacturing/core/2015/02">\n'
+                        '<resources><object id="1" type="model"><mesh>\n<vertices>\n')
+            np.savetxt(model, vertices, fmt='<vertex x="%.4f" y="%.4f" z="%.4f"/>')
+            model.write('</vertices>\n<triangles>\n')
+            np.savetxt(model, triangles, fmt='<triangle v1="%d" v2="%d" v3="%d"/>')
+            model.write('</triangles>\n</mesh></object></resources>\n<build><item objectid="1"/></build>\n</model>\n')
+    return out.getvalue()
+
+def mesh_bytes(vertices, triangles, out):
+    if out == '3mf':
+        return threemf_bytes(vertices, triangles)
+    return stl_bytes(vertices, triangles)
@@ -0,0 +1,174 @@
+# Mesh backend for the stl and 3mf output: the extruded outline and the hinge parts are triangle
+# meshes and the booleans are done by manifold3d, the file is written from the triangles. The parts are
+# the same solids of normal_hinge_parts and ball_joint_parts, with the circles made of
+# circular_segments sides. The step output always uses cadquery.
+#   python flexifier_mesh.py dog.png --hinges hinges.json   compares the two backends
+import argparse
+import json
+import os
+import sys
+import time
+from math import sqrt
+import numpy as np
+from flexifier import (hor_tolerance, vert_tolerance, chamfer_multi, HingeCache, no_progress, normalize_hinges,
+                       image_outline, render_modes)
+from flexifier_outline import place_outline, extrude_outline
+
+try:
+    from manifold3d import CrossSection, FillRule, Manifold, OpType
+except ImportError:  # the cadquery backend still works
+    Manifold = None
+
+circular_segments = 64  # sides of the cylinders and of the spheres
+
+def available():
+    return Manifold is not None
+
+def box(size, corner):
+    return Manifold.cube(size).translate(corner)
+
+def y_cylinder(length, radius, x, z):
+    # cylinder along the Y axis centered in (x, 0, z)
+    return Manifold.cylinder(length, radius, circular_segments=circular_segments, center=True).rotate((90, 0, 0)).translate((x, 0, z))
+
+def x_cylinder(length, radius, z):
+    return Manifold.cylinder(length, radius, circular_segments=circular_segments, center=True).rotate((0, 90, 0)).translate((0, 0, z))
+
+def sphere(radius, x, z):
+    return Manifold.sphere(radius, circular_segments).translate((x, 0, z))
+
+def cut_parts(h, height):
+    chamfer = h['h_break']*chamfer_multi
+    cut_im = box((h['h_break'], h['h_break_len'], height), (-h['h_break']/2, -h['h_break_len']/2, 0))
+    chamfer_top = Manifold.cube((chamfer, h['h_break_len'], chamfer), center=True).rotate((0, 45, 0))
+    chamfer_bot = chamfer_top.translate((0, 0, height))
+    return [cut_im + chamfer_top + chamfer_bot]
+
+def normal_hinge_parts(h, height):
+    chamfer = h['h_break']*chamfer_multi
+    pin_diam = (h['h_diam']-vert_tolerance)/3
+    x_hinge = -h['h_break']/2-pin_diam/2
+    hole_h_im_x = (h['h_diam'] + pin_diam)/2 + hor_tolerance
+    hole_width = h['h_thick']+hor_tolerance*2
+    hole_im = box((hole_h_im_x, hole_width, height), (-hole_h_im_x-h['h_break']/2, -hole_width/2, 0))
+    hole_diam = pin_diam + vert_tolerance
+    hinge_corn = box((hole_h_im_x/2+chamfer*sqrt(2), h['h_thick'], h['h_diam']), (x_hinge, -h['h_thick']/2, height/2-h['h_diam']/2))
+    hinge_ext = y_cylinder(h['h_thick'], h['h_diam']/2, x_hinge, height/2)
+    hinge_hole = y_cylinder(h['h_thick'], hole_diam/2, x_hinge, height/2)
+    hinge_pin = y_cylinder(h['h_thick']+hor_tolerance*2, pin_diam/2, x_hinge, height/2)
+    return cut_parts(h, height) + [hole_im], [hinge_corn + hinge_ext - hinge_hole + hinge_pin]
+
+def ball_joint_parts(h, height):
+    hole_diam = h['h_diam']+vert_tolerance
+    x_ball = h['h_break']/2+hole_diam/2
+    hole_im1 = sphere(hole_diam/2, -x_ball, height/2)
+    hole_im2 = sphere(hole_diam/2, x_ball, height/2)
+    if h['h_expose']:
+        join_x = h['h_break']+(h['h_diam']/2+hor_tolerance)*2
+        join_y = h['h_diam']/2+hor_tolerance
+        hole_join = box((join_x, join_y, height), (-join_x/2, -join_y/2, 0))
+    else:
+        hole_join = x_cylinder(h['h_break']+h['h_diam'], h['h_diam']/4+hor_tolerance, height/2)
+    ball1 = sphere(h['h_diam']/2, -x_ball, height/2)
+    ball2 = sphere(h['h_diam']/2, x_ball, height/2)
+    join = x_cylinder(h['h_break']+h['h_diam'], h['h_diam']/4, height/2)
+    return cut_parts(h, height) + [hole_im1 + hole_im2 + hole_join], [ball1 + ball2 + join]
+
+def build_hinge_parts(h, height):
+    if h['type'] == 'normal':
+        return normal_hinge_parts(h, height)
+    return ball_joint_parts(h, height)
+
+mesh_hinge_cache = HingeCache(int(os.environ.get('FLEXIFIER_HINGE_CACHE', 256)), build=build_hinge_parts)
+
+def hinge_parts(h, height):
+    diff, uni = mesh_hinge_cache.get(h, height)
+    move = lambda part: part.rotate((0, 0, h['h_rot'])).translate((h['h_tran'][0], h['h_tran'][1], 0))
+    return [move(part) for part in diff], [move(part) for part in uni]
+
+def extrude_mesh(outline, height):
+    # the holes are the rings inside an odd number of rings, like outline_faces
+    return Manifold.extrude(CrossSection([np.asarray(ring, dtype=np.float64) for ring in outline], FillRule.EvenOdd), height)
+
+def render_mesh(outline, hinges, height, progress=no_progress):
+    # same order of the batched render: all the cuts and then all the added parts
+    if not available():
+        raise RuntimeError('the mesh backend needs the manifold3d package')
+    timings = dict()
+    start = time.time()
+    progress(0, 1, 'extrude')
+    model = extrude_mesh(outline, height)
+    timings['extrude'] = time.time() - start
+    start = time.time()
+    diff = list()
+    uni = list()
+    steps = len(hinges) + 2
+    for ind, h in enumerate(hinges.values()):
+        progress(ind, steps, f'parts of hinge {ind + 1} of {len(hinges)}')
+        h_diff, h_uni = hinge_parts(h, height)
+        diff += h_diff
+        uni += h_uni
+    timings['build parts'] = time.time() - start
+    start = time.time()
+    progress(len(hinges), steps, f'cut of {len(diff)} parts')
+    if diff:
+        model = Manifold.batch_boolean([model] + diff, OpType.Subtract)
+    timings['cut'] = time.time() - start
+    start = time.time()
+    progress(len(hinges) + 1, steps, f'fuse of {len(uni)} parts')
+    if uni:
+        model = Manifold.batch_boolean([model] + uni, OpType.Add)
+    timings['fuse'] = time.time() - start
+    progress(steps, steps, 'hinges done')
+    return model, timings
+
+def mesh_arrays(model):
+    # vertices and triangles of the mesh, written by flexifier_export
+    mesh = model.to_mesh()
+    return np.asarray(mesh.vert_properties)[:, :3], np.asarray(mesh.tri_verts)
+
+def compare(model, res, volume_tol=0.01, box_tol=0.1):
+    # geometric equivalence of the mesh model and of the cadquery model: volume within
+    # volume_tol (relative, the mesh circles are polygons) and bounding box within box_tol mm
+    solid = res.findSolid()
+    cq_box = solid.BoundingBox()
+    cq_bounds = np.array([cq_box.xmin, cq_box.ymin, cq_box.zmin, cq_box.xmax, cq_box.ymax, cq_box.zmax])
+    mesh_bounds = np.array(model.bounding_box())
+    cq_volume = solid.Volume()
+    volume_error = abs(model.volume() - cq_volume) / cq_volume if cq_volume else abs(model.volume())
+    box_error = float(np.abs(mesh_bounds - cq_bounds).max())
+    return {'mesh_volume': model.volume(), 'cadquery_volume': cq_volume, 'volume_error': volume_error,
+            'mesh_box': mesh_bounds.tolist(), 'cadquery_box': cq_bounds.tolist(), 'box_error': box_error,
+            'equivalent': volume_error <= volume_tol and box_error <= box_tol}
+
+def check(data, filetype, hinges, height=10.0, scales=(0.4, 0.4), tran=(0.0, 0.0), rot=0.0):
+    # renders the same model with both backends and compares them
+    hinges = normalize_hinges(hinges, height)
+    outline = place_outline(image_outline(data, filetype), scales, tran, rot)
+    start = time.time()
+    res, _ = render_modes['batched'](hinges, extrude_outline(outline, height), height)
+    cq_time = time.time() - start
+    start = time.time()
+    model, _ = render_mesh(outline, hinges, height)
+    mesh_time = time.time() - start
+    return dict(compare(model, res), cadquery_seconds=cq_time, mesh_seconds=mesh_time)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the mesh backend with the cadquery backend')
+    parser.add_argument('input', help='png/jpg/svg image')
+    parser.add_argument('--height', type=float, default=10.0)
+    parser.add_argument('--scale', type=float, nargs=2, default=[0.4, 0.4])
+    parser.add_argument('--hinges', help='json file with the list of hinges')
+    args = parser.parse_args(argv)
+    hinges = list()
+    if args.hinges:
+        with open(args.hinges) as f:
+            hinges = json.load(f)
+    with open(args.input, 'rb') as f:
+        data = f.read()
+    result = check(data, args.input.rsplit('.', 1)[-1].lower(), hinges, height=args.height, scales=args.scale)
+    print(json.dumps(result, indent=2))
+    return 0 if result['equivalent'] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
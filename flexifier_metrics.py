@@ -0,0 +1,167 @@
+# Metrics of the renders. Every render gives a record with the seconds of every stage and the
+# sizes of its input and output (pixels, segments, hinges, faces, bytes): the records are
+# appended as json lines to metrics_file and summed in counters exported in the Prometheus text
+# format, served on metrics_port (http://host:port/metrics) or written to a file by the batch CLI.
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+metrics_file = os.environ.get('FLEXIFIER_METRICS_FILE')  # json lines, one per render or preview
+metrics_port = int(os.environ.get('FLEXIFIER_METRICS_PORT', 0))  # 0: no http endpoint
+sizes = ['input_bytes', 'input_pixels', 'segments', 'simplified_segments', 'hinges', 'faces', 'output_bytes']
+buckets = [0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800]  # seconds of the render histogram
+
+def stage_name(phase):
+    # the booleans of the single hinges of the sequential mode are summed in one stage
+    return 'hinge' if re.fullmatch(r'hinge \d+', phase) else phase
+
+def render_record(seconds, timings, stats, status='ok', **labels):
+    # input, backend, mode and out are the usual labels, error the message of a failed render
+    record = {'kind': 'render', 'time': time.time(), 'status': status, 'seconds': seconds, 'stages': dict(timings)}
+    record.update({size: stats[size] for size in sizes if stats.get(size) is not None})
+    record.update(labels)
+    return record
+
+def preview_record(engine, seconds, subprocess_seconds=0.0, error=''):
+    # error is the message of an engine that failed before this one
+    return {'kind': 'preview', 'time': time.time(), 'engine': engine, 'seconds': seconds, 'subprocess_seconds': subprocess_seconds,
+            'error': error}
+
+def label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class Metrics:
+    # counters of the records seen by this process
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.renders = Counter()
+        self.stage_seconds = Counter()
+        self.stage_runs = Counter()
+        self.size_totals = Counter()
+        self.bucket_counts = [0] * len(buckets)
+        self.render_seconds = 0.0
+        self.previews = Counter()
+        self.preview_seconds = Counter()
+        self.subprocess_seconds = Counter()
+        self.preview_fallbacks = Counter()
+        self.slowest = None
+
+    def observe(self, record):
+        with self.lock:
+            if record['kind'] == 'preview':
+                self.previews[record['engine']] += 1
+                self.preview_seconds[record['engine']] += record['seconds']
+                self.subprocess_seconds[record['engine']] += record['subprocess_seconds']
+                if record.get('error'):
+                    self.preview_fallbacks[record['engine']] += 1
+                return
+            self.renders[(record['status'], record.get('backend', ''), record.get('mode', ''))] += 1
+            for phase, seconds in record['stages'].items():
+                self.stage_seconds[stage_name(phase)] += seconds
+                self.stage_runs[stage_name(phase)] += 1
+            for size in sizes:
+                self.size_totals[size] += record.get(size, 0)
+            if record['status'] != 'ok':
+                return
+            self.render_seconds += record['seconds']
+            for pos, bound in enumerate(buckets):
+                if record['seconds'] <= bound:
+                    self.bucket_counts[pos] += 1
+            if self.slowest is None or record['seconds'] > self.slowest['seconds']:
+                self.slowest = record
+
+    def text(self):
+        # Prometheus text exposition format
+        lines = list()
+
+        def metric(name, kind, doc, samples, suffix=''):
+            lines.append(f'# HELP {name} {doc}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                text = ','.join(f'{key}="{label(v)}"' for key, v in labels.items())
+                lines.append(f'{name}{suffix}{{{text}}} {value}' if text else f'{name}{suffix} {value}')
+
+        with self.lock:
+            metric('flexifier_renders_total', 'counter', 'Renders by status, backend and mode.',
+                   [({'status': s, 'backend': b, 'mode': m}, n) for (s, b, m), n in sorted(self.renders.items())])
+            ok = sum(n for (s, _, _), n in self.renders.items() if s == 'ok')
+            metric('flexifier_render_seconds', 'histogram', 'Wall time of the successful renders.',
+                   [({'le': bound}, count) for bound, count in zip(buckets, self.bucket_counts)] +
+                   [({'le': '+Inf'}, ok)], '_bucket')
+            lines.append(f'flexifier_render_seconds_sum {self.render_seconds}')
+            lines.append(f'flexifier_render_seconds_count {ok}')
+            metric('flexifier_stage_seconds_total', 'counter', 'Seconds spent in every stage of the renders.',
+                   [({'stage': stage}, seconds) for stage, seconds in sorted(self.stage_seconds.items())])
+            metric('flexifier_stage_runs_total', 'counter', 'Runs of every stage of the renders.',
+                   [({'stage': stage}, runs) for stage, runs in sorted(self.stage_runs.items())])
+            for size in sizes:
+                metric(f'flexifier_{size}_total', 'counter', f'Sum of the {size.replace("_", " ")} of the renders.',
+                       [(dict(), self.size_totals[size])])
+            metric('flexifier_previews_total', 'counter', 'Previews by engine.',
+                   [({'engine': engine}, n) for engine, n in sorted(self.previews.items())])
+            metric('flexifier_preview_seconds_total', 'counter', 'Seconds spent drawing the previews.',
+                   [({'engine': engine}, seconds) for engine, seconds in sorted(self.preview_seconds.items())])
+            metric('flexifier_subprocess_seconds_total', 'counter', 'Wall time of the external programs (openscad).',
+                   [({'engine': engine}, seconds) for engine, seconds in sorted(self.subprocess_seconds.items())])
+            metric('flexifier_preview_fallbacks_total', 'counter', 'Previews drawn by an engine after the chosen one failed.',
+                   [({'engine': engine}, n) for engine, n in sorted(self.preview_fallbacks.items())])
+            if self.slowest is not None:
+                metric('flexifier_slowest_render_seconds', 'gauge', 'Slowest render seen by this process.',
+                       [({'input': self.slowest.get('input', '')}, self.slowest['seconds'])])
+        return '\n'.join(lines) + '\n'
+
+registry = Metrics()
+file_lock = threading.Lock()
+
+def record(entry, path=None):
+    # counts the record and appends it to the json lines file
+    registry.observe(entry)
+    path = path or metrics_file
+    if path:
+        with file_lock, open(path, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+
+def write_text(path):
+    # the text of the counters, replaced atomically for the node exporter textfile collector
+    folder = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=folder, prefix='.tmp-')
+    with os.fdopen(fd, 'w') as f:
+        f.write(registry.text())
+    # mkstemp creates the file for this user only, the collector may run as another user
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, path)
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = registry.text().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+server = None
+
+def serve(port=None):
+    # http endpoint of the counters in a daemon thread, started once per process
+    global server
+    port = port or metrics_port
+    if server is None and port:
+        try:
+            server = ThreadingHTTPServer(('', port), MetricsHandler)
+        except OSError as e:
+            print('metrics endpoint disabled:', e)
+            return None
+        threading.Thread(target=server.serve_forever, name='flexifier-metrics', daemon=True).start()
+    return server
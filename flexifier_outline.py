@@ -0,0 +1,534 @@
+# Outline of the model: closed polylines in mm read from an svg or from the traced image,
+# placed like openscad `import(center=true)` + scale + rotate + translate, and extruded
+# directly with cadquery without going through a dxf.
+import re
+import xml.etree.ElementTree as ET
+from math import ceil, cos, radians, sin, sqrt, atan2, pi
+import cadquery as cq
+import numpy as np
+
+dpi = 72  # openscad reads px and unitless svg lengths at 72 dpi
+curve_segments = 8  # segments of every bezier curve
+chord_tolerance = 0.01  # mm between the arcs and circles of an svg and their segments, at scale 1
+units = {'': 25.4 / dpi, 'px': 25.4 / dpi, 'pt': 25.4 / 72, 'pc': 25.4 / 6, 'mm': 1.0, 'cm': 10.0, 'in': 25.4}
+_number = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+_command = re.compile(r'[MmLlHhVvCcSsQqTtAaZz]')
+_skipped = {'defs', 'clipPath', 'mask', 'symbol', 'metadata', 'title', 'desc', 'style', 'pattern', 'marker'}
+
+def _length(value, default=None):
+    if value is None:
+        return default
+    match = re.match(r'\s*([-+]?[\d.eE+-]+)\s*([a-z]*)', value)
+    if not match or match.group(2) not in units:
+        return default
+    return float(match.group(1)) * units[match.group(2)]
+
+def _transform(text):
+    # 3x3 matrix of an svg transform attribute
+    matrix = np.eye(3)
+    for name, args in re.findall(r'(\w+)\s*\(([^)]*)\)', text or ''):
+        v = [float(n) for n in _number.findall(args)]
+        if name == 'matrix':
+            m = np.array([[v[0], v[2], v[4]], [v[1], v[3], v[5]], [0, 0, 1]])
+        elif name == 'translate':
+            m = np.array([[1, 0, v[0]], [0, 1, v[1] if len(v) > 1 else 0], [0, 0, 1]])
+        elif name == 'scale':
+            m = np.diag([v[0], v[1] if len(v) > 1 else v[0], 1])
+        elif name == 'rotate':
+            a = radians(v[0])
+            m = np.array([[cos(a), -sin(a), 0], [sin(a), cos(a), 0], [0, 0, 1]])
+            if len(v) == 3:
+                m = _transform(f'translate({v[1]},{v[2]})') @ m @ _transform(f'translate({-v[1]},{-v[2]})')
+        elif name == 'skewX':
+            m = np.array([[1, np.tan(radians(v[0])), 0], [0, 1, 0], [0, 0, 1]])
+        elif name == 'skewY':
+            m = np.array([[1, 0, 0], [np.tan(radians(v[0])), 1, 0], [0, 0, 1]])
+        else:
+            continue
+        matrix = matrix @ m
+    return matrix
+
+def _tokens(d):
+    # commands and numbers of a path, arc flags can be written without separators
+    pos = 0
+    while pos < len(d):
+        if d[pos] in ' \t\r\n,':
+            pos += 1
+            continue
+        match = _command.match(d, pos) or _number.match(d, pos)
+        if not match:
+            pos += 1
+            continue
+        yield match.group()
+        pos = match.end()
+
+def _bezier(points, n=None):
+    # points of a quadratic or cubic bezier curve, without the first one
+    n = n or curve_segments
+    t = np.linspace(0, 1, n + 1)[1:, None]
+    p = np.array(points)
+    if len(p) == 3:
+        return (1 - t) ** 2 * p[0] + 2 * (1 - t) * t * p[1] + t ** 2 * p[2]
+    return (1 - t) ** 3 * p[0] + 3 * (1 - t) ** 2 * t * p[1] + 3 * (1 - t) * t ** 2 * p[2] + t ** 3 * p[3]
+
+def _arc_segments(radius, angle, tolerance):
+    # segments of an arc whose chords are at most tolerance from it, and at least
+    # curve_segments / 2 for a quarter of a turn
+    step = 2 * np.arccos(max(1 - tolerance / radius, -1.0)) if tolerance > 0 else 0.0
+    n = ceil(abs(angle) / step) if step > 0 else 0
+    return max(n, ceil(abs(angle) / (pi / 2) * curve_segments / 2), 1)
+
+def _arc(start, rx, ry, phi, large, sweep, end, tolerance=chord_tolerance):
+    # points of an svg elliptical arc, without the first one
+    if rx == 0 or ry == 0 or np.allclose(start, end):
+        return [end]
+    rx, ry, phi = abs(rx), abs(ry), radians(phi)
+    c, s = cos(phi), sin(phi)
+    dx, dy = (start[0] - end[0]) / 2, (start[1] - end[1]) / 2
+    x1, y1 = c * dx + s * dy, -s * dx + c * dy
+    scale = x1 ** 2 / rx ** 2 + y1 ** 2 / ry ** 2
+    if scale > 1:
+        rx, ry = rx * sqrt(scale), ry * sqrt(scale)
+    num = max(rx ** 2 * ry ** 2 - rx ** 2 * y1 ** 2 - ry ** 2 * x1 ** 2, 0)
+    coef = sqrt(num / (rx ** 2 * y1 ** 2 + ry ** 2 * x1 ** 2)) * (-1 if large == sweep else 1)
+    cx1, cy1 = coef * rx * y1 / ry, -coef * ry * x1 / rx
+    cx, cy = c * cx1 - s * cy1 + (start[0] + end[0]) / 2, s * cx1 + c * cy1 + (start[1] + end[1]) / 2
+    theta = atan2((y1 - cy1) / ry, (x1 - cx1) / rx)
+    delta = atan2((-y1 - cy1) / ry, (-x1 - cx1) / rx) - theta
+    if sweep and delta < 0:
+        delta += 2 * pi
+    elif not sweep and delta > 0:
+        delta -= 2 * pi
+    n = _arc_segments(max(rx, ry), delta, tolerance)
+    a = theta + delta * np.linspace(0, 1, n + 1)[1:]
+    x, y = rx * np.cos(a), ry * np.sin(a)
+    return np.stack([c * x - s * y + cx, s * x + c * y + cy], axis=1)
+
+def path_rings(d, tolerance=chord_tolerance):
+    # closed polylines of the subpaths of an svg path, the arcs within tolerance (svg units)
+    rings, ring = list(), list()
+    pos = np.zeros(2)
+    start = np.zeros(2)
+    control = None
+    command = None
+    tokens = list(_tokens(d))
+    i = 0
+
+    def take(n):
+        nonlocal i
+        if i + n > len(tokens) or any(_command.fullmatch(v) for v in tokens[i:i + n]):
+            raise ValueError('truncated path')
+        values = [float(v) for v in tokens[i:i + n]]
+        i += n
+        return values
+
+    def flag():
+        # arc flags are a single digit, "011" is two flags and a number
+        nonlocal i
+        if i >= len(tokens) or tokens[i][0] not in '01':
+            raise ValueError('bad arc flag')
+        if len(tokens[i]) > 1:
+            token, tokens[i] = tokens[i][0], tokens[i][1:]
+        else:
+            token = tokens[i]
+            i += 1
+        return token == '1'
+
+    try:
+        while i < len(tokens):
+            if _command.fullmatch(tokens[i]):
+                command = tokens[i]
+                i += 1
+            elif command is None:
+                break
+            relative = command.islower()
+            offset = pos if relative else np.zeros(2)
+            cmd = command.upper()
+            if cmd == 'Z':
+                if len(ring) > 2:
+                    rings.append(np.array(ring))
+                ring = list()
+                pos = start.copy()
+                control = None
+                continue
+            if cmd == 'M':
+                if len(ring) > 2:
+                    rings.append(np.array(ring))
+                pos = offset + take(2)
+                start = pos.copy()
+                ring = [pos]
+                # the next coordinates without a command are lines
+                command = 'l' if relative else 'L'
+                control = None
+                continue
+            if cmd == 'L':
+                points = [offset + take(2)]
+            elif cmd == 'H':
+                x = take(1)[0]
+                points = [np.array([x + offset[0], pos[1]])]
+            elif cmd == 'V':
+                y = take(1)[0]
+                points = [np.array([pos[0], y + offset[1]])]
+            elif cmd in 'CS':
+                if cmd == 'C':
+                    c1 = offset + take(2)
+                else:
+                    c1 = 2 * pos - control if control is not None and control_kind == 'C' else pos
+                c2 = offset + take(2)
+                end = offset + take(2)
+                points = _bezier([pos, c1, c2, end])
+                control, control_kind = c2, 'C'
+            elif cmd in 'QT':
+                if cmd == 'Q':
+                    c1 = offset + take(2)
+                else:
+                    c1 = 2 * pos - control if control is not None and control_kind == 'Q' else pos
+                end = offset + take(2)
+                points = _bezier([pos, c1, end])
+                control, control_kind = c1, 'Q'
+            else:
+                rx, ry, phi = take(3)
+                large, sweep = flag(), flag()
+                end = offset + take(2)
+                points = _arc(pos, rx, ry, phi, large, sweep, end, tolerance)
+            if cmd not in 'CSQT':
+                control = None
+            ring += list(points)
+            pos = np.array(points[-1], dtype=float)
+    except ValueError:
+        # keep what was read of a truncated path
+        pass
+    if len(ring) > 2:
+        rings.append(np.array(ring))
+    return rings
+
+def _element_rings(element, tag, tolerance=chord_tolerance):
+    get = lambda name: float(element.get(name, 0) or 0)
+    if tag == 'path':
+        return path_rings(element.get('d', ''), tolerance)
+    if tag in ('polygon', 'polyline'):
+        values = [float(v) for v in _number.findall(element.get('points', ''))]
+        return [np.array(values[:len(values) // 2 * 2]).reshape(-1, 2)] if len(values) >= 6 else []
+    if tag == 'rect':
+        x, y, w, h = get('x'), get('y'), get('width'), get('height')
+        return [np.array([[x, y], [x + w, y], [x + w, y + h], [x, y + h]])] if w > 0 and h > 0 else []
+    if tag in ('circle', 'ellipse'):
+        rx = get('r') if tag == 'circle' else get('rx')
+        ry = get('r') if tag == 'circle' else get('ry')
+        a = np.linspace(0, 2 * pi, _arc_segments(max(rx, ry), 2 * pi, tolerance), endpoint=False)
+        return [np.stack([get('cx') + rx * np.cos(a), get('cy') + ry * np.sin(a)], axis=1)] if rx > 0 and ry > 0 else []
+    return []
+
+def svg_outline(data):
+    # closed polylines of all the shapes of an svg, in mm with y pointing up like openscad
+    root = ET.fromstring(data)
+    view_box = [float(v) for v in _number.findall(root.get('viewBox', ''))]
+    matrix = np.eye(3)
+    if len(view_box) == 4 and view_box[2] > 0 and view_box[3] > 0:
+        width = _length(root.get('width'), view_box[2] * units[''])
+        height = _length(root.get('height'), view_box[3] * units[''])
+        matrix = np.diag([width / view_box[2], height / view_box[3], 1]) @ _transform(f'translate({-view_box[0]},{-view_box[1]})')
+    else:
+        matrix = np.diag([units[''], units[''], 1])
+    # flip the y axis
+    matrix = np.diag([1, -1, 1]) @ matrix
+    rings = list()
+    # the elements that <use> can reference
+    ids = {element.get('id'): element for element in root.iter() if element.get('id')}
+    href = ('href', '{http://www.w3.org/1999/xlink}href')
+
+    def walk(element, matrix, used=()):
+        tag = element.tag.rsplit('}', 1)[-1]
+        if tag in _skipped or element.get('display') == 'none' or 'display:none' in element.get('style', '').replace(' ', ''):
+            return
+        matrix = matrix @ _transform(element.get('transform'))
+        if tag == 'use':
+            # the referenced element (a <symbol> too) drawn at x, y; a reference to itself is skipped
+            ref = next((element.get(name) for name in href if element.get(name)), '').lstrip('#')
+            target = ids.get(ref)
+            if target is None or ref in used:
+                return
+            matrix = matrix @ _transform(f"translate({element.get('x') or 0},{element.get('y') or 0})")
+            if target.tag.rsplit('}', 1)[-1] == 'symbol':
+                for child in target:
+                    walk(child, matrix, used + (ref,))
+            else:
+                walk(target, matrix, used + (ref,))
+            return
+        # the tolerance of the arcs in the units of the element
+        scale = sqrt(abs(np.linalg.det(matrix[:2, :2])))
+        for ring in _element_rings(element, tag, chord_tolerance / scale if scale > 0 else chord_tolerance):
+            points = np.c_[ring, np.ones(len(ring))] @ matrix.T
+            rings.append(points[:, :2])
+        for child in element:
+            walk(child, matrix, used)
+
+    walk(root, matrix)
+    if not rings:
+        raise ValueError('no closed shape in the svg, text and images must be converted to paths')
+    return rings
+
+def pixels_to_mm(contours, size):
+    # traced contours (pixels, y down) in mm with y up, like the svg written for openscad
+    return [np.c_[c[:, 0], size[1] - c[:, 1]] * units['pt'] for c in contours]
+
+def place_outline(contours, scales, tran, rot):
+    # center the bounding box on the origin, then scale, rotate and translate
+    if not contours:
+        return list()
+    points = np.concatenate(contours)
+    center = (points.min(axis=0) + points.max(axis=0)) / 2
+    a = radians(rot)
+    matrix = np.array([[cos(a), -sin(a)], [sin(a), cos(a)]]) @ np.diag(scales)
+    return [(c - center) @ matrix.T + tran for c in contours]
+
+def outline_box(contours):
+    # xmin, ymin, xmax, ymax of the placed outline
+    points = np.concatenate(contours)
+    return (*points.min(axis=0), *points.max(axis=0))
+
+def outline_segments(contours):
+    # every ring is closed, a ring of n points has n segments
+    return sum(len(c) for c in contours)
+
+def _decimate(contours, tolerance):
+    # douglas-peucker on all the rings together: every loop splits all the open intervals at
+    # their farthest point, the intervals within the tolerance keep only their ends. The error
+    # of every kept point is the distance of the removed points from the segment after it
+    closed = [np.vstack([c, c[:1]]) for c in contours]
+    sizes = np.array([len(c) for c in closed])
+    points = np.concatenate(closed)
+    offsets = np.cumsum(sizes) - sizes
+    keep = np.zeros(len(points), dtype=bool)
+    keep[offsets] = keep[offsets + sizes - 1] = True
+    error = np.zeros(len(points))
+    starts, ends = offsets, offsets + sizes - 1
+    while len(starts):
+        inner = ends - starts - 1
+        starts, ends, inner = starts[inner > 0], ends[inner > 0], inner[inner > 0]
+        if not len(starts):
+            break
+        interval = np.repeat(np.arange(len(starts)), inner)
+        index = np.arange(inner.sum()) - np.repeat(np.cumsum(inner) - inner, inner) + starts[interval] + 1
+        a, b, p = points[starts][interval], points[ends][interval], points[index]
+        # distance from the chord, from its first point when the chord is a point (a whole ring)
+        ab = b - a
+        length = np.einsum('ij,ij->i', ab, ab)
+        t = np.clip(np.einsum('ij,ij->i', p - a, ab) / np.where(length > 0, length, 1), 0, 1)
+        distance = np.hypot(*(a + ab * t[:, None] - p).T)
+        # first farthest point of every interval
+        farthest = np.flatnonzero(distance == np.maximum.reduceat(distance, np.cumsum(inner) - inner)[interval])
+        first = farthest[np.r_[True, interval[farthest][1:] != interval[farthest][:-1]]]
+        split = distance[first] > tolerance
+        error[starts[~split]] = distance[first][~split]
+        far = index[first][split]
+        keep[far] = True
+        starts, ends = np.concatenate([starts[split], far]), np.concatenate([far, ends[split]])
+    rings = np.cumsum(sizes)[:-1]
+    kept = [k[:-1] for k in np.split(keep, rings)]
+    return [c[k] for c, k in zip(contours, kept)], [e[:-1][k] for e, k in zip(np.split(error, rings), kept)]
+
+def _ring_links(sizes):
+    # previous and next point of every point of the concatenated rings
+    offsets = np.cumsum(sizes) - sizes
+    index = np.arange(sizes.sum())
+    ring = np.repeat(np.arange(len(sizes)), sizes)
+    local = index - offsets[ring]
+    return offsets[ring] + (local - 1) % sizes[ring], offsets[ring] + (local + 1) % sizes[ring], ring
+
+def ring_areas(contours):
+    # unsigned area of every ring
+    if not contours:
+        return np.zeros(0)
+    sizes = np.array([len(c) for c in contours])
+    points = np.concatenate(contours)
+    _, following, ring = _ring_links(sizes)
+    cross = points[:, 0] * points[following, 1] - points[:, 1] * points[following, 0]
+    return np.abs(np.bincount(ring, weights=cross, minlength=len(sizes))) / 2
+
+def _merge_collinear(contours, angle, tolerance=0.0, errors=None):
+    # removes the points where the direction changes less than angle (degrees), never two
+    # neighbours at once; errors (one per point, zero by default) bound the distance of the
+    # original points from the segment after every point, a point is removed only while the
+    # bound of the merged segment stays within tolerance
+    limit = np.sin(radians(angle))
+    sizes = np.array([len(c) for c in contours])
+    points = np.concatenate(contours)
+    error = np.concatenate(errors) if errors is not None else np.zeros(len(points))
+    while True:
+        previous, following, ring = _ring_links(sizes)
+        before = points - points[previous]
+        after = points[following] - points
+        norms = np.hypot(*before.T) * np.hypot(*after.T)
+        cross = before[:, 0] * after[:, 1] - before[:, 1] * after[:, 0]
+        dot = np.einsum('ij,ij->i', before, after)
+        # distance of the point from the segment between its neighbours
+        chord = points[following] - points[previous]
+        length = np.einsum('ij,ij->i', chord, chord)
+        t = np.clip(np.einsum('ij,ij->i', before, chord) / np.where(length > 0, length, 1), 0, 1)
+        distance = np.hypot(*(points[previous] + chord * t[:, None] - points).T)
+        merged = np.maximum(error[previous], error) + distance
+        straight = ((norms == 0) | ((np.abs(cross) <= limit * norms) & (dot > 0))) & (sizes[ring] > 3) & (merged <= tolerance)
+        straight &= ~straight[previous]
+        if not straight.any():
+            break
+        error[previous[straight]] = merged[straight]
+        points, error = points[~straight], error[~straight]
+        sizes = sizes - np.bincount(ring[straight], minlength=len(sizes))
+    return np.split(points, np.cumsum(sizes)[:-1])
+
+def simplify_outline(contours, tolerance, min_area=0.0, angle=1.0):
+    # fewer segments for the extrusion and the booleans: the rings (islands and holes) smaller than
+    # min_area (mm^2) are dropped, the points are decimated within tolerance (mm) and the segments
+    # turning less than angle (degrees) are merged; no original point moves farther than tolerance
+    # from the simplified outline
+    contours = [c for c in contours if len(c) > 2]
+    contours = [c for c, area in zip(contours, ring_areas(contours)) if area > min_area]
+    errors = None
+    if tolerance > 0 and contours:
+        contours, errors = _decimate(contours, tolerance)
+    if angle > 0 and contours:
+        contours = _merge_collinear(contours, angle, tolerance, errors)
+    contours = [c for c in contours if len(c) > 2]
+    return [c for c, area in zip(contours, ring_areas(contours)) if area > min_area]
+
+def ring_area(ring):
+    x, y = ring[:, 0], ring[:, 1]
+    return 0.5 * (np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+
+def _ray_containers(rays, points, starts, ends, ring, chunk=2**22):
+    # (ray, ring) pairs of the rings around points[ray]: a ray from the point to the right crosses
+    # them an odd number of times. The segments are kept in horizontal bands, every ray is only
+    # tested against the segments of its band and the (ray, segment) pairs are checked in chunks
+    low, high = np.minimum(starts[:, 1], ends[:, 1]), np.maximum(starts[:, 1], ends[:, 1])
+    segments = np.flatnonzero(high > low)
+    origin = low.min()
+    band = max(float(np.mean(high[segments] - low[segments])), (high.max() - origin) / len(segments), 1e-9)
+    first = ((low[segments] - origin) // band).astype(np.int64)
+    counts = ((high[segments] - origin) // band).astype(np.int64) - first + 1
+    members = np.repeat(segments, counts)
+    bands = np.repeat(first, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    order = np.argsort(bands, kind='stable')
+    bands, members = bands[order], members[order]
+    ray_bands = ((points[rays, 1] - origin) // band).astype(np.int64)
+    lo = np.searchsorted(bands, ray_bands)
+    pairs = np.searchsorted(bands, ray_bands, side='right') - lo
+    total = np.cumsum(pairs)
+    found = list()
+    pos = 0
+    while pos < len(rays):
+        stop = max(int(np.searchsorted(total, (total[pos - 1] if pos else 0) + chunk, side='right')), pos + 1)
+        n = pairs[pos:stop]
+        ray = np.repeat(rays[pos:stop], n)
+        seg = members[np.repeat(lo[pos:stop] - np.cumsum(n) + n, n) + np.arange(n.sum())]
+        a, b, p = starts[seg], ends[seg], points[ray]
+        crossing = ((a[:, 1] > p[:, 1]) != (b[:, 1] > p[:, 1])) & (ring[seg] != ray)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_cross = a[:, 0] + (p[:, 1] - a[:, 1]) * (b[:, 0] - a[:, 0]) / (b[:, 1] - a[:, 1])
+        hit = crossing & (p[:, 0] < x_cross)
+        keys, hits = np.unique(ray[hit] * len(points) + ring[seg][hit], return_counts=True)
+        found.append(keys[hits % 2 == 1])
+        pos = stop
+    keys = np.concatenate(found) if found else np.zeros(0, dtype=np.int64)
+    return keys // len(points), keys % len(points)
+
+def ring_nesting(contours):
+    # parent (-1 for none) and depth of every ring of an outline whose rings do not cross.
+    # Every ring is crossed by one of a set of horizontal lines and the crossings of every line
+    # are sorted by x: the crossing right of the rightmost crossing of a ring on its line is on a
+    # ring Q, the ring is inside Q when the inside of Q is on the left of that crossing and it
+    # has the parent of Q otherwise. The rings whose chain of neighbours does not end in a parent
+    # (rings hooked into each other) are tested with a ray against all the rings.
+    count = len(contours)
+    parent = np.full(count, -1)
+    depth = np.zeros(count, dtype=np.int64)
+    if count < 2:
+        return parent, depth
+    sizes = np.array([len(c) for c in contours])
+    offsets = np.cumsum(sizes) - sizes
+    starts = np.concatenate(contours)
+    _, following, ring = _ring_links(sizes)
+    ends = starts[following]
+    low, high = np.minimum(starts[:, 1], ends[:, 1]), np.maximum(starts[:, 1], ends[:, 1])
+    ring_low, ring_high = np.minimum.reduceat(starts[:, 1], offsets), np.maximum.reduceat(starts[:, 1], offsets)
+    flat = ring_high <= ring_low
+    if flat.all():
+        return parent, depth
+    # lines every `step`, at least as many as the segments cross, and a line in the middle of the
+    # rings that fall between two lines
+    origin = ring_low.min()
+    step = max(float((ring_high - ring_low)[~flat].min()), float((high - low).sum()) / len(starts))
+    grid = origin + np.arange(int((ring_high.max() - origin) // step) + 1) * step
+    between = ~flat & (origin + np.ceil((ring_low - origin) / step) * step >= ring_high)
+    lines = np.unique(np.r_[grid, (ring_low[between] + ring_high[between]) / 2])
+    # crossings of the segments with the lines, a line at y crosses the segments with low <= y < high
+    first = np.searchsorted(lines, low)
+    counts = np.searchsorted(lines, high) - first
+    seg = np.repeat(np.arange(len(starts)), counts)
+    line = np.repeat(first, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    a, b = starts[seg], ends[seg]
+    x = a[:, 0] + (lines[line] - a[:, 1]) * (b[:, 0] - a[:, 0]) / (b[:, 1] - a[:, 1])
+    order = np.lexsort((x, line))
+    seg, line = seg[order], line[order]
+    # rightmost crossing of every ring on the first line through it and the crossing after it
+    own = np.flatnonzero(line == np.searchsorted(lines, ring_low)[ring[seg]])
+    rightmost = np.full(count, -1)
+    np.maximum.at(rightmost, ring[seg[own]], own)
+    after = np.minimum(rightmost + 1, len(seg) - 1)
+    hit = (rightmost >= 0) & (rightmost + 1 < len(seg)) & (line[after] == line[rightmost])
+    neighbour = np.where(hit, ring[seg[after]], -1)
+    # the inside of a counterclockwise ring is on the left of its segments
+    cross = starts[:, 0] * ends[:, 1] - starts[:, 1] * ends[:, 0]
+    counterclockwise = np.bincount(ring, weights=cross, minlength=count) > 0
+    inside = hit & ((ends[seg[after], 1] > starts[seg[after], 1]) == counterclockwise[np.maximum(neighbour, 0)])
+    parent = np.where(inside, neighbour, -1)
+    known = ~hit | inside
+    # the rings next to a sibling take its parent, by pointer jumping
+    target = neighbour.copy()
+    for _ in range(int(np.log2(count)) + 2):
+        pending = np.flatnonzero(~known)
+        if not len(pending):
+            break
+        ready = known[target[pending]]
+        parent[pending[ready]] = parent[target[pending[ready]]]
+        known[pending[ready]] = True
+        target[pending[~ready]] = target[target[pending[~ready]]]
+    pending = np.flatnonzero(~known)
+    if len(pending):
+        inner, outer = _ray_containers(pending, starts[offsets], starts, ends, ring)
+        # the smallest ring around a ring is its parent
+        order = np.lexsort((ring_areas(contours)[outer], inner))
+        inner, outer = inner[order], outer[order]
+        head = np.r_[True, inner[1:] != inner[:-1]]
+        parent[pending] = -1
+        parent[inner[head]] = outer[head]
+    # depth: rings above every ring, by pointer jumping
+    depth = (parent >= 0).astype(np.int64)
+    jump = parent.copy()
+    while (jump >= 0).any():
+        up = jump >= 0
+        depth[up] += depth[jump[up]]
+        jump[up] = jump[jump[up]]
+    return parent, depth
+
+def outline_faces(contours):
+    # (outer ring, holes) of every face: the rings inside an odd number of rings are holes
+    contours = [c for c in contours if len(c) > 2]
+    areas = ring_areas(contours)
+    contours = [c for c, area in zip(contours, areas) if area > 0]
+    areas = areas[areas > 0]
+    parent, depth = ring_nesting(contours)
+    order = np.argsort(-areas)
+    faces = {ind: (contours[ind], list()) for ind in order if depth[ind] % 2 == 0}
+    for ind in order:
+        if depth[ind] % 2 == 1:
+            faces[parent[ind]][1].append(contours[ind])
+    return list(faces.values())
+
+def _wire(ring):
+    return cq.Wire.makePolygon([cq.Vector(x, y, 0) for x, y in ring], close=True)
+
+def extrude_outline(contours, height):
+    solids = [cq.Solid.extrudeLinear(_wire(outer), [_wire(hole) for hole in holes], cq.Vector(0, 0, height))
+              for outer, holes in outline_faces(contours)]
+    return cq.Workplane('XY').newObject(solids)
@@ -0,0 +1,104 @@
+# Top view of the model drawn with Pillow: the placed outline, the cut of every hinge and
+# the footprint of the parts added by the hinge, with the same shapes of the openscad preview.
+from io import BytesIO
+from math import cos, radians, sin, sqrt
+import numpy as np
+from PIL import Image, ImageColor, ImageDraw
+from flexifier import vert_tolerance, chamfer_multi
+
+background = (255, 255, 229)  # colours of the openscad preview
+model_color = (249, 215, 44)
+unknown_color = (128, 128, 128)
+
+def hinge_footprint(h):
+    # polygons (local frame) of the cut and of the parts added by the hinge, seen from the top
+    b, d = h['h_break'], h['h_diam']
+    cut = [box(-b / 2, -h['h_break_len'] / 2, b / 2, h['h_break_len'] / 2)]
+    if h['type'] == 'normal':
+        t = h['h_thick']
+        chamfer = b * chamfer_multi
+        pin_diam = (d - vert_tolerance) / 3
+        x_hinge = -b / 2 - pin_diam / 2
+        corner_x = -(chamfer * sqrt(2) / 2 - b / 2) / 2
+        corner_w = b / 2 + chamfer * sqrt(2) / 2
+        parts = [box(x_hinge - d / 2, -t / 2, x_hinge + d / 2, t / 2),
+                 box(corner_x - corner_w / 2, -t / 2, corner_x + corner_w / 2, t / 2)]
+    else:
+        x_ball = d / 2 + b / 2
+        parts = [circle(-x_ball, 0, d / 2), circle(x_ball, 0, d / 2),
+                 box(-(d + b) / 2, -d / 4, (d + b) / 2, d / 4)]
+    return cut, parts
+
+def box(x0, y0, x1, y1):
+    return np.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1]])
+
+def circle(x, y, r, n=24):
+    a = np.linspace(0, 2 * np.pi, n, endpoint=False)
+    return np.stack([x + r * np.cos(a), y + r * np.sin(a)], axis=1)
+
+def place(points, h):
+    a = radians(h['h_rot'])
+    return points @ np.array([[cos(a), sin(a)], [-sin(a), cos(a)]]) + h['h_tran']
+
+def color_rgb(name):
+    try:
+        return ImageColor.getrgb(name)
+    except ValueError:
+        return unknown_color
+
+def even_odd_mask(points, sizes, width, height):
+    # pixels inside an odd number of rings, without the nesting of the rings: the rings are the
+    # points (in pixels) taken sizes at a time, on every row the crossings of the segments with
+    # the line through the pixel centers toggle the pixels on their right
+    starts = points
+    following = np.arange(1, len(points) + 1)
+    following[np.cumsum(sizes) - 1] = np.cumsum(sizes) - sizes
+    ends = points[following]
+    low, high = np.minimum(starts[:, 1], ends[:, 1]), np.maximum(starts[:, 1], ends[:, 1])
+    first = np.maximum(np.ceil(low - 0.5), 0).astype(np.int64)
+    last = np.minimum(np.ceil(high - 0.5) - 1, height - 1).astype(np.int64)
+    counts = np.maximum(last - first + 1, 0)
+    segment = np.repeat(np.arange(len(starts)), counts)
+    rows = np.repeat(first, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    a, b = starts[segment], ends[segment]
+    x = a[:, 0] + (rows + 0.5 - a[:, 1]) * (b[:, 0] - a[:, 0]) / (b[:, 1] - a[:, 1])
+    cols = np.clip(np.ceil(x - 0.5), 0, width).astype(np.int64)
+    toggles = np.bincount(rows * (width + 1) + cols, minlength=height * (width + 1)).reshape(height, width + 1)
+    return (np.cumsum(toggles, axis=1) & 1)[:, :width].astype(bool)
+
+def draw_preview(outline, hinges, colors, size=800, margin=0.05):
+    # png bytes of the top view, hinge `ind` is drawn with colors[ind-1]
+    shapes = [(ind, *(place(p, h) for p in hinge_footprint(h)[1])) for ind, h in hinges.items()]
+    points = [np.concatenate(outline)] if outline else []
+    points += [p for shape in shapes for p in shape[1:]]
+    if not points:
+        points = [np.array([[-50.0, -50.0], [50.0, 50.0]])]
+    points = np.concatenate(points)
+    low, high = points.min(axis=0), points.max(axis=0)
+    span = np.maximum(high - low, 1e-6)
+    scale = size * (1 - 2 * margin) / span.max()
+    width, height = (span * scale + 2 * margin * size).astype(int)
+    offset = margin * size - low * scale
+
+    def pixels(ring):
+        xy = ring * scale + offset
+        xy[:, 1] = height - xy[:, 1]
+        return xy
+
+    canvas = np.empty((int(height), int(width), 3), dtype=np.uint8)
+    canvas[:] = background
+    if outline:
+        sizes = np.array([len(ring) for ring in outline])
+        canvas[even_odd_mask(pixels(np.concatenate(outline)), sizes, int(width), int(height))] = model_color
+    image = Image.fromarray(canvas)
+    draw = ImageDraw.Draw(image)
+    # the cuts are removed from the model, the added parts are drawn over it
+    for ind, h in hinges.items():
+        for cut in hinge_footprint(h)[0]:
+            draw.polygon([tuple(p) for p in pixels(place(cut, h))], fill=background, outline=color_rgb(colors[ind - 1]))
+    for ind, *parts in shapes:
+        for part in parts:
+            draw.polygon([tuple(p) for p in pixels(part)], fill=color_rgb(colors[ind - 1]))
+    out = BytesIO()
+    image.save(out, 'png', compress_level=1)
+    return out.getvalue()
@@ -0,0 +1,139 @@
+# Trace a raster image to closed polylines in memory, replacing convert + potrace.
+# The dark pixels are the model: the alpha channel is flattened on white, the image is
+# thresholded and the borders of the dark regions are followed with marching squares.
+from io import BytesIO
+from math import ceil, sqrt
+import numpy as np
+from PIL import Image
+
+threshold = 128  # grey level below which a pixel is part of the model
+max_pixels = 4_000_000  # bigger images are downsampled before tracing
+turdsize = 2  # regions up to this area in pixels are dropped, like potrace
+
+# corners of a marching squares cell (x, y) with y pointing down: tl, tr, br, bl
+_corners = np.array([[0, 0], [1, 0], [1, 1], [0, 1]])
+# middle points of the cell edges in half pixels: top, right, bottom, left
+_edges = np.array([[1, 0], [2, 1], [1, 2], [0, 1]])
+# edges next to each corner
+_corner_edges = {0: (3, 0), 1: (0, 1), 2: (1, 2), 3: (2, 3)}
+
+def _orient(a, b, ref):
+    # segment from edge a to edge b with the point ref (in half pixels) on its left
+    pa, pb = _edges[a], _edges[b]
+    cross = (pb[0] - pa[0]) * (ref[1] - pa[1]) - (pb[1] - pa[1]) * (ref[0] - pa[0])
+    return (a, b) if cross < 0 else (b, a)
+
+def _segment_table():
+    # for each of the 16 cases the segments, oriented so that the model is always on the same side
+    table = dict()
+    for case in range(1, 15):
+        filled = [c for c in range(4) if case >> (3 - c) & 1]
+        empty = [c for c in range(4) if c not in filled]
+        if len(filled) == 1 or (len(filled) == 2 and abs(filled[0] - filled[1]) == 2):
+            table[case] = [_orient(*_corner_edges[c], _corners[c] * 2) for c in filled]
+        elif len(filled) == 3:
+            a, b = _corner_edges[empty[0]]
+            b, a = _orient(a, b, _corners[empty[0]] * 2)
+            table[case] = [(a, b)]
+        else:
+            side = sorted(set(_corner_edges[filled[0]]) ^ set(_corner_edges[filled[1]]))
+            table[case] = [_orient(*side, _corners[filled].sum(axis=0))]
+    return table
+
+_table = _segment_table()
+
+def image_size(data):
+    # width and height in pixels, from the header of the image without decoding it
+    with Image.open(BytesIO(data)) as image:
+        return image.size
+
+def image_mask(data, max_size=None):
+    # boolean mask of the model pixels and the size of a mask pixel in image pixels
+    max_size = max_size or max_pixels
+    image = Image.open(BytesIO(data))
+    image.load()
+    factor = 1
+    if image.width * image.height > max_size:
+        factor = ceil(sqrt(image.width * image.height / max_size))
+        if image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            image = image.convert('RGBA')
+        image = image.reduce(factor)
+    image = image.convert('RGBA') if 'A' in image.getbands() or image.mode == 'P' else image.convert('RGB')
+    pixels = np.asarray(image, dtype=np.float32)
+    rgb = pixels[..., :3]
+    if pixels.shape[-1] == 4:
+        # transparent pixels become white
+        alpha = pixels[..., 3:] / 255
+        rgb = rgb * alpha + 255 * (1 - alpha)
+    grey = rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    return grey < threshold, factor
+
+def mask_contours(mask, min_area=0):
+    # closed polylines (x, y) in pixels around the True regions of the mask bigger than min_area
+    padded = np.pad(mask, 1).astype(np.uint8)
+    cases = padded[:-1, :-1] << 3 | padded[:-1, 1:] << 2 | padded[1:, 1:] << 1 | padded[1:, :-1]
+    starts, ends = list(), list()
+    for case, segments in _table.items():
+        rows, cols = np.nonzero(cases == case)
+        if not len(rows):
+            continue
+        origin = np.stack([cols, rows], axis=1) * 2
+        for a, b in segments:
+            starts.append(origin + _edges[a])
+            ends.append(origin + _edges[b])
+    if not starts:
+        return list()
+    starts = np.concatenate(starts)
+    ends = np.concatenate(ends)
+    # every point is the start of exactly one segment: link each segment to the next one
+    width = padded.shape[1] * 2 + 1
+    start_keys = starts[:, 1] * width + starts[:, 0]
+    order = np.argsort(start_keys)
+    following = order[np.searchsorted(start_keys[order], ends[:, 1] * width + ends[:, 0])]
+    # number the loops with the smallest segment of each loop, by pointer jumping
+    count = len(starts)
+    index = np.arange(count)
+    label = index.copy()
+    jump = following.copy()
+    while True:
+        lowest = np.minimum(label, label[jump])
+        if np.array_equal(lowest, label):
+            break
+        label = lowest
+        jump = jump[jump]
+    # distance of every segment from the last segment of its loop, by list ranking
+    tail = label[following] == following
+    jump = np.where(tail, index, following)
+    rank = (~tail).astype(np.int64)
+    while not np.array_equal(jump, jump[jump]):
+        rank = rank + rank[jump]
+        jump = jump[jump]
+    # keep only the corners, the middle points of straight runs are useless
+    previous = np.empty_like(following)
+    previous[following] = index
+    direction = starts[following] - starts
+    corner = np.any(direction != direction[previous], axis=1)
+    # signed area of every loop, the points are in half pixels
+    cross = starts[:, 0] * starts[following, 1] - starts[:, 1] * starts[following, 0]
+    area = np.bincount(label, weights=cross, minlength=count) / 8
+    keep = corner & (np.abs(area[label]) > min_area)
+    if not keep.any():
+        return list()
+    order = np.lexsort((-rank[keep], label[keep]))
+    points = starts[keep][order] / 2 - 0.5  # half pixels of the padded mask to pixels of the image
+    loops = label[keep][order]
+    splits = np.nonzero(np.diff(loops))[0] + 1
+    return np.split(points, splits)
+
+def trace(data, max_size=None):
+    # closed polylines in image pixels (y pointing down) and the image size in pixels
+    mask, factor = image_mask(data, max_size)
+    contours = [c * factor for c in mask_contours(mask, turdsize)]
+    return contours, (mask.shape[1] * factor, mask.shape[0] * factor)
+
+def contours_to_svg(contours, size):
+    # one pt per pixel like potrace, the holes have the opposite orientation of their outline
+    path = ' '.join('M ' + ' L '.join(f'{x:.2f} {y:.2f}' for x, y in contour) + ' Z' for contour in contours)
+    return (f'<?xml version="1.0" standalone="no"?>\n'
+            f'<svg xmlns="http://www.w3.org/2000/svg" version="1.1" width="{size[0]}pt" height="{size[1]}pt" '
+            f'viewBox="0 0 {size[0]} {size[1]}">\n<path d="{path}" fill="#000000" stroke="none"/>\n</svg>\n')
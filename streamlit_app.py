@@ -1,18 +1,20 @@
 import subprocess
 # import plotly
-import cadquery as cq
-import numpy as np
 # from stl import mesh  # pip install numpy-stl
 # import plotly.graph_objects as go
 import streamlit as st
 from PIL import Image
-import os
 import time
 import base64 # to download from html link
+from copy import deepcopy
 from math import sqrt
-hor_tolerance= 0.8
-vert_tolerance= 0.8
-chamfer_multi = 1
+from flexifier_preview import draw_preview
+from flexifier_outline import outline_box
+from flexifier_check import validate, errors
+from flexifier_cache import artifact_cache, artifact_key, digest, memory_store, outline_nbytes
+from flexifier_metrics import record, render_record, preview_record, serve
+from flexifier_export import mesh_formats, linear_tolerance, angular_tolerance
+from flexifier import render_modes, default_hinge, trace_image, place_outline, prepare_outline, Workspace, clean_workspaces, RenderJob, session_job, mesh_job, model_key, backends, model_backend, expand_hinges, hinge_names, pattern_kinds, default_pattern, input_pixels, trace_key, placement_key
 
 def create_download_link(val, filename):
     b64 = base64.b64encode(val)
@@ -72,70 +74,19 @@ def figure_mesh(filename):
   fig.write_html("file_stl.html")
   return fig
 
-def cut_image(h, res):
-    chamfer = h['h_break']*chamfer_multi
-    # cut image
-    cut_im =  cq.Workplane('XY').box(h['h_break'], h['h_break_len'],height,centered=(1,1,0)).rotate([0,0,0], [0,0,1], h['h_rot']).translate([h['h_tran'][0],h['h_tran'][1],0])
-    # chamfer
-    chamfer_top = cq.Workplane('XY').box(chamfer, h['h_break_len'],chamfer).rotate([0,0,0], [0,1,0], 45).rotate([0,0,0], [0,0,1], h['h_rot']).translate([h['h_tran'][0],h['h_tran'][1],0])
-    chamfer_bot = cq.Workplane('XY').box(chamfer, h['h_break_len'],chamfer).rotate([0,0,0], [0,1,0], 45).rotate([0,0,0], [0,0,1], h['h_rot']).translate([h['h_tran'][0],h['h_tran'][1],height])
-    res -= cut_im + chamfer_top + chamfer_bot
-    return res
-
-def normal_hinge(h, res):
-    ### Diff part
-    chamfer = h['h_break']*chamfer_multi
-    pin_diam = (h['h_diam']-vert_tolerance)/3
-    x_hinge = -h['h_break']/2-pin_diam/2
-    res = cut_image(h, res)
-    # hinge hole
-    hole_h_im_x = (h['h_diam'] + pin_diam)/2 + hor_tolerance
-    hole_im = cq.Workplane('XY').box(hole_h_im_x, h['h_thick']+hor_tolerance*2,height,centered=(1,1,0)).translate([-hole_h_im_x/2-h['h_break']/2,0,0]).rotate([0,0,0], [0,0,1], h['h_rot']).translate([h['h_tran'][0],h['h_tran'][1],0])
-    res -= hole_im
-    ### Uni part
-    hole_diam = pin_diam + vert_tolerance
-    # hinge corner
-    # hinge_corn = cq.Workplane('XZ').box(cq.Workplane('XY').box(hole_h_im_x, h['h_thick']+hor_tolerance*2,height,centered=(1,1,0)).translate([-hole_h_im_x/2-h['h_break']/2,0,0]).rotate([0,0,0], [0,0,1], h['h_rot']).translate([h['h_tran'][0],h['h_tran'][1],0])/2 + pin_diam/2+chamfer*sqrt(2),h['h_diam'], h['h_thick'], centered=(0,0,1)).translate([-h['h_break']/2 -pin_diam/2,0,height/2-h['h_diam']/2]).rotate([0,0,0], [0,0,1], h['h_rot']).translate([h['h_tran'][0],h['h_tran'][1],0])
-    hinge_corn = cq.Workplane('XZ').box(hole_h_im_x/2+chamfer*sqrt(2),h['h_diam'], h['h_thick'], centered=(0,0,1)).translate([-h['h_break']/2 -pin_diam/2,0,height/2-h['h_diam']/2]).rotate([0,0,0], [0,0,1], h['h_rot']).translate([h['h_tran'][0],h['h_tran'][1],0])
-    # External hinge
-    hinge_ext =  cq.Workplane('XZ').cylinder(h['h_thick'], h['h_diam']/2, centered=(1,0,1)).translate([x_hinge,0,height/2-h['h_diam']/2]).rotate([0,0,0], [0,0,1], h['h_rot']).translate([h['h_tran'][0],h['h_tran'][1],0])
-    hinge_hole =  cq.Workplane('XZ').cylinder(h['h_thick'], hole_diam/2, centered=(1,0,1)).translate([x_hinge,0,height/2-hole_diam/2]).rotate([0,0,0], [0,0,1], h['h_rot']).translate([h['h_tran'][0],h['h_tran'][1],0])
-    hinge_pin =  cq.Workplane('XZ').cylinder(h['h_thick']+hor_tolerance*2, pin_diam/2, centered=(1,0,1)).translate([x_hinge,0,height/2-pin_diam/2]).rotate([0,0,0], [0,0,1], h['h_rot']).translate([h['h_tran'][0],h['h_tran'][1],0])
-    res += hinge_corn + hinge_ext - hinge_hole + hinge_pin
-    return res
-
-def ball_joint(h, res):
-    res = cut_image(h, res)
-    hole_diam = h['h_diam']+vert_tolerance
-    ### Diff part
-    hole_im1 = cq.Workplane('XY').sphere(hole_diam/2).translate([-h['h_break']/2-hole_diam/2,0,height/2]).rotate([0,0,0], [0,0,1], h['h_rot']).translate([h['h_tran'][0],h['h_tran'][1],0])
-    hole_im2 = cq.Workplane('XY').sphere(hole_diam/2).translate([+h['h_break']/2+hole_diam/2,0,height/2]).rotate([0,0,0], [0,0,1], h['h_rot']).translate([h['h_tran'][0],h['h_tran'][1],0])
-    if h['h_expose']:
-        hole_join = cq.Workplane('XY').box(h['h_break']+(h['h_diam']/2+hor_tolerance)*2, h['h_diam']/2+hor_tolerance,height,centered=(1,1,0)).rotate([0,0,0], [0,0,1], h['h_rot']).translate([h['h_tran'][0],h['h_tran'][1],0])
-    else:
-        hole_join = cq.Workplane('YZ').cylinder(h['h_break']+h['h_diam'], h['h_diam']/4+hor_tolerance).translate([0,0,height/2]).rotate([0,0,0], [0,0,1], h['h_rot']).translate([h['h_tran'][0],h['h_tran'][1],0])
-    res -= hole_im1 + hole_im2 + hole_join
-    ### Uni part
-    ball1 = cq.Workplane('XY').sphere(h['h_diam']/2).translate([-h['h_break']/2-hole_diam/2,0,height/2]).rotate([0,0,0], [0,0,1], h['h_rot']).translate([h['h_tran'][0],h['h_tran'][1],0])
-    ball2 = cq.Workplane('XY').sphere(h['h_diam']/2).translate([+h['h_break']/2+hole_diam/2,0,height/2]).rotate([0,0,0], [0,0,1], h['h_rot']).translate([h['h_tran'][0],h['h_tran'][1],0])
-    join = cq.Workplane('YZ').cylinder(h['h_break']+h['h_diam'], h['h_diam']/4).translate([0,0,height/2]).rotate([0,0,0], [0,0,1], h['h_rot']).translate([h['h_tran'][0],h['h_tran'][1],0])
-    res += ball1 + ball2 + join
-    return res
-
-
-def build_preview(hinges, template):
+def build_preview(hinges, template, colors):
     union = str()
     difference = str()
     for ind, h in hinges.items():
         if h['type'] == 'normal':
             union = union + f"""
-    color("{color[ind-1]}")
+    color("{colors[ind-1]}")
     translate([{h['h_tran'][0]},{h['h_tran'][1]},0])
     rotate([0,0,{h['h_rot']}])
     uni_hinge({height}, hinge_diam={h['h_diam']}, hinge_h_thick={h['h_thick']}, break={h['h_break']});"""
         elif h['type'] == 'ball':
             union = union + f"""
-color("{color[ind-1]}")
+color("{colors[ind-1]}")
 translate([{h['h_tran'][0]},{h['h_tran'][1]},0])
 rotate([0,0,{h['h_rot']}])
 uni_ball({height}, ball_diam={h['h_diam']}, break={h['h_break']});"""
@@ -145,13 +96,6 @@ rotate([0,0,{h['h_rot']}])
 diff({height}, break={h['h_break']}, break_len={h['h_break_len']});"""
     return template + difference + '};\n' + union
 
-svg_to_dxf = """
-translate(v=[{X_TRAN},{Y_TRAN},0])
-  rotate(a=[0,0,{Z_DEG}])
-    scale([{X_SCALE},{Y_SCALE},1])
-      import(file = "file.svg", center = true);
-"""
-
 preview_template = """
 $fn=10;
 
@@ -196,7 +140,7 @@ difference(){{
 """
 
 color = ['red', 'navy', 'green', 'purple', 'silver', 'orange', 'indigo', 'teal', 'darkslategray',
-    'yellowgreen', 'cyan', 'cornflowerblue', 'magenta', 'tan', 'darkred', 'deeppink', 'olive', 'lightsalmon', 'mocassin', 'rosybrown']
+    'yellowgreen', 'cyan', 'cornflowerblue', 'magenta', 'tan', 'darkred', 'deeppink', 'olive', 'lightsalmon', 'moccasin', 'rosybrown']
 
 if __name__ == "__main__":
     for key in ('xlen', 'ylen', 'xmin', 'xmax', 'ymin', 'ymax'):
@@ -206,15 +150,20 @@ if __name__ == "__main__":
         st.session_state['hinges'] = dict()
     hinges = st.session_state['hinges']
     if 'image_value' not in st.session_state:
-        st.session_state['image_value'] = [0]
+        st.session_state['image_value'] = None
     if hinges and max(list(hinges)) > len(color)-2:
         n_colors = len(hinges)//len(color)
         color = color * (n_colors+2)
 
+    # the metrics endpoint is served once per process when FLEXIFIER_METRICS_PORT is set
+    serve()
+    # every session works in its own folder, removed when the session ends
+    if 'workspace' not in st.session_state:
+        clean_workspaces()
+        st.session_state['workspace'] = Workspace()
+    workspace = st.session_state['workspace']
     # clean memory
-    for file in ['file.stl', 'preview.png']:
-        if file in os.listdir():
-            os.remove(file)
+    workspace.remove('preview.png')
 
     st.title('Flexifier: make it flexi')
     st.write("Generate flexi 3D models from images! If you like the project put a like on [Printables](https://www.printables.com/it/model/505713-flexifier-make-it-flexi) or [support me with a coffee](https://www.paypal.com/donate/?hosted_button_id=V4LJ3Z3B3KXRY)! On Printables you can find more info about the project.", unsafe_allow_html=True)
@@ -224,9 +173,18 @@ if __name__ == "__main__":
     with col1:
         filetype = st.selectbox('Input file type', ['png', 'jpg', 'svg', 'jpeg'])
     with col2:
-        out = st.selectbox('Output file type', ['stl', 'step'])
+        out = st.selectbox('Output file type', ['stl', '3mf', 'step'], help='3mf is a compressed mesh, much smaller than the stl')
     with col3:
         interface = st.selectbox('Interface', ['slider', 'number'])
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        backend = st.selectbox('Geometry backend', backends, help='mesh does the booleans on triangle meshes, much faster but only for stl and 3mf (step always uses cadquery)')
+    with col2:
+        render_mode = st.selectbox('Render mode', list(render_modes), help='batched runs a single cut and a single fuse for all the hinges, faster with many hinges; pieces splits the model along the cuts and builds the pieces in parallel processes, faster on long models with many cores')
+    with col3:
+        incremental = st.checkbox('Incremental render', value=True, help='recompute only the hinges changed since the last render')
+    with col4:
+        preview_engine = st.selectbox('Preview', ['native', 'openscad'], help='native draws the top view in python, openscad needs openscad and xvfb')
     numb = False
     if interface == 'number':
         numb = True
@@ -235,19 +193,24 @@ if __name__ == "__main__":
     if uploaded_file is not None:
         # To read file as bytes:
         bytes_data = uploaded_file.getvalue()
-        with open(f'file.{filetype}', 'wb') as f:
-            f.write(bytes_data)
-        image_value = [bytes_data]
-
-        # calculate the svg if the imgage is different from the previous one
-        if image_value[0] != st.session_state['image_value'][0]:
-            # avoid transparency in PNG, replace it with white
-            if filetype == 'png':
-                subprocess.run(f'convert file.{filetype} -background white -alpha remove -alpha off file.{filetype}', shell = True)
-            # convert the img to svg
-            if filetype != 'svg':
-                subprocess.run(f'convert file.{filetype} file.pnm', shell=True)
-                subprocess.run(f'potrace -s -o file.svg file.pnm', shell=True)
+        image_digest = digest(bytes_data)
+
+        # the outline of the image is in the store shared by the sessions, the session keeps only
+        # its key: the image is traced again only if no session has it in memory. The svg of the
+        # openscad preview is stored with it, and written in the workspace only for that preview
+        outline_key = trace_key(image_digest, filetype)
+        traced = memory_store.get(outline_key)
+        if traced is None:
+            start = time.time()
+            try:
+                traced = trace_image(bytes_data, filetype)
+            except ValueError as e:
+                # an svg without any shape read (text, images, broken references)
+                st.error(f'Not able to read the outline of the file: {e}', icon="🚨")
+                st.stop()
+            memory_store.put(outline_key, traced, outline_nbytes(traced[0]) + len(traced[1]))
+            st.session_state['trace_seconds'] = time.time() - start
+        traced_outline = traced[0]
     
         # MODIFY IMAGE
         col1, col2, col3 = st.columns(3)
@@ -268,7 +231,6 @@ if __name__ == "__main__":
             with col2:
                 if numb: scales[1] = scales[1] * st.number_input('Y scale %', min_value=0.0, value=100.0) / 100
                 else: scales[1] = scales[1] * st.slider('Y scale %', 0.0, 500.0, step=0.1, value=100.0) / 100
-        image_value.append(scales)
 
         # TRANSLATE
         tran = [0.0, 0.0]
@@ -280,7 +242,6 @@ if __name__ == "__main__":
             with col2:
                 if numb: tran[1] = st.number_input('Move Y', value=0.0)
                 else: tran[1] = st.slider('Move Y', 0.0, 200.0, step=0.1, value=0.0)
-        image_value.append(tran)
 
         # ROTATE
         rot = 0
@@ -289,28 +250,47 @@ if __name__ == "__main__":
             with col1:
                 if numb: rot = st.number_input('Rotation Angle', value=0.0)
                 else: rot = st.slider('Rotation Angle', 0.0, 360.0, step=0.1, value=0.0)
-        image_value.append(rot)
 
 
         if numb: height = st.number_input('Model height (mm)', 0.0, 100.0 , 10.0)
         else: height = st.slider('Model height (mm)', 0.0, 100.0 , 10.0)
 
-        # calculate bounding box only if it's a different image
+        # SIMPLIFY
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            if numb: tolerance = st.number_input('Simplify tolerance (mm)', 0.0, 5.0, 0.0, help='points closer than this to the simplified outline are removed, 0 keeps every point')
+            else: tolerance = st.slider('Simplify tolerance (mm)', 0.0, 2.0, step=0.01, value=0.0, help='points closer than this to the simplified outline are removed, 0 keeps every point')
+        with col2:
+            if numb: min_area = st.number_input('Minimum area (mm²)', 0.0, 1000.0, 0.0, help='islands and holes smaller than this are dropped')
+            else: min_area = st.slider('Minimum area (mm²)', 0.0, 100.0, step=0.1, value=0.0, help='islands and holes smaller than this are dropped')
+        outline, (segments, simplified_segments) = prepare_outline(traced_outline, scales, tran, rot, tolerance, min_area)
+        with col3:
+            st.caption(f'Outline: {segments} segments' + (f', {simplified_segments} after the simplification' if segments != simplified_segments else ''))
+
+        # TESSELLATION of the stl and 3mf written from the cadquery model
+        tessellation = (linear_tolerance, angular_tolerance)
+        if out in mesh_formats and model_backend(backend, out) == 'cadquery':
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                if numb: linear = st.number_input('Mesh tolerance (mm)', 0.001, 2.0, linear_tolerance, format='%.3f', help='distance between the surface of the model and the triangles, smaller is smoother and bigger')
+                else: linear = st.slider('Mesh tolerance (mm)', 0.01, 1.0, step=0.01, value=linear_tolerance, help='distance between the surface of the model and the triangles, smaller is smoother and bigger')
+            with col2:
+                if numb: angular = st.number_input('Mesh angular tolerance (rad)', 0.01, 1.5, angular_tolerance, help='angle between the sides of the curves, smaller is smoother and bigger')
+                else: angular = st.slider('Mesh angular tolerance (rad)', 0.05, 1.0, step=0.05, value=angular_tolerance, help='angle between the sides of the curves, smaller is smoother and bigger')
+            tessellation = (linear, angular)
+
+        # calculate bounding box only if it's a different image or placement
+        image_value = placement_key(image_digest, filetype, scales, tran, rot)
         if image_value != st.session_state['image_value']:
             try:
-                print('CALCOLO DXF')
-                # CREATE DXF AND CALCULATE THE BOUNDING BOX
-                with open("svg_to_dxf.scad", 'w') as f:
-                    f.write(svg_to_dxf.format(X_TRAN=tran[0], Y_TRAN=tran[1], X_SCALE=scales[0], Y_SCALE=scales[1], Z_DEG=rot))
-                subprocess.run(f'openscad svg_to_dxf.scad -o file.dxf', shell = True)
-                result = (cq.importers.importDXF("file.dxf").wires().toPending().extrude(height))
-                b_box = result.combine().objects[0].BoundingBox()
-                st.session_state['xlen'] = b_box.xlen
-                st.session_state['ylen'] = b_box.ylen
-                st.session_state['xmin'] = b_box.xmin
-                st.session_state['xmax'] = b_box.xmax
-                st.session_state['ymin'] = b_box.ymin
-                st.session_state['ymax'] = b_box.ymax
+                # bounding box of the placed outline
+                b_xmin, b_ymin, b_xmax, b_ymax = outline_box(place_outline(traced_outline, scales, tran, rot))
+                st.session_state['xlen'] = b_xmax - b_xmin
+                st.session_state['ylen'] = b_ymax - b_ymin
+                st.session_state['xmin'] = b_xmin
+                st.session_state['xmax'] = b_xmax
+                st.session_state['ymin'] = b_ymin
+                st.session_state['ymax'] = b_ymax
             except:
                 st.warning('Not able to calculate the bounding box', icon="⚠️")
                 st.session_state['xlen'] = 200.0
@@ -341,15 +321,7 @@ if __name__ == "__main__":
             if st.button('Add'):
                 if not hinges: #always start with at least one hinge
                     ind = 1
-                    hinges[ind] = dict()
-                    hinges[ind]['type'] = hinge_type
-                    hinges[ind]['h_tran'] = [0.0, 0.0]
-                    hinges[ind]['h_rot'] = 0.0
-                    hinges[ind]['h_break'] = 3.0
-                    hinges[ind]['h_break_len'] = 100.0
-                    hinges[ind]['h_diam'] = height
-                    hinges[ind]['h_thick'] = 5.0
-                    hinges[ind]['h_expose'] = True
+                    hinges[ind] = default_hinge(height, hinge_type)
                     st.session_state['hinges'].update(hinges)
                     st.rerun()
                 else:
@@ -415,63 +387,200 @@ if __name__ == "__main__":
             hinges[ref]['h_diam'] = h_diam
             hinges[ref]['h_break'] = h_break
             hinges[ref]['h_break_len'] = h_break_len
+
+            # PATTERN: many hinges with the same parameters in a single entry
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                kinds = ['none'] + pattern_kinds
+                pattern = hinges[ref].get('pattern')
+                pattern_kind = st.selectbox('Pattern', kinds, index=kinds.index(pattern['kind']) if pattern else 0,
+                                            help='line: hinges along a direction centered on the hinge position, axis: along the longest axis of the image, radial: on a circle around the hinge position')
+            if pattern_kind == 'none':
+                hinges[ref].pop('pattern', None)
+            else:
+                pattern = dict(default_pattern(pattern_kind), **dict(pattern or dict(), kind=pattern_kind))
+                with col2:
+                    pattern['count'] = int(st.number_input('Hinges in the pattern', 1, 100, int(pattern['count'])))
+                with col3:
+                    if pattern_kind == 'line':
+                        if numb: pattern['step'] = st.number_input('Pattern step', value=pattern['step'])
+                        else: pattern['step'] = st.slider('Pattern step', 0.1, max([ylen, xlen]), step=0.1, value=min(pattern['step'], max([ylen, xlen])))
+                    elif pattern_kind == 'radial':
+                        if numb: pattern['radius'] = st.number_input('Pattern radius', value=pattern['radius'])
+                        else: pattern['radius'] = st.slider('Pattern radius', 0.1, max([ylen, xlen]), step=0.1, value=min(pattern['radius'], max([ylen, xlen])))
+                with col4:
+                    if pattern_kind != 'axis':
+                        if numb: pattern['angle'] = st.number_input('Pattern angle', value=pattern['angle'])
+                        else: pattern['angle'] = st.slider('Pattern angle', 0.0, 360.0, step=0.1, value=pattern['angle'])
+                hinges[ref]['pattern'] = pattern
             st.session_state['hinges'].update(hinges)
+        # the patterns are expanded to the hinges they make
+        expanded, parents = expand_hinges(hinges, outline) if outline else (dict(), dict())
+        hinge_colors = [color[parents[ind]-1] for ind in expanded]
+        # CHECK the hinges against the outline, a render known to fail is not started
+        problems = validate(outline, expanded, height, hinge_names(parents))
+        for level, message in problems:
+            if level == 'error':
+                st.error(message, icon="🚨")
+            else:
+                st.warning(message, icon="⚠️")
         #PREPARE FILES
-        preview = False
-        if not st.button('Render'):
-            preview = True
-        if preview:
-            height_model = height/2
-            openscad_template = preview_template
-            # resize the scale of the svg
-            templ = openscad_template.format(HEIGHT=height_model, X_TRAN=tran[0], Y_TRAN=tran[1], X_SCALE=scales[0], Y_SCALE=scales[1], Z_DEG=rot)
-            run = build_preview(st.session_state['hinges'], templ)
-            with open('run.scad', 'w') as f:
-                f.write(run)
-            if preview:
-                subprocess.run('xvfb-run -a openscad -o preview.png --camera 0,0,0,0,0,0,0 --autocenter --viewall --view axes,scales  --projection=ortho run.scad', shell = True)
+        if st.button('Render', disabled=bool(errors(problems)), help='fix the errors of the hinges to render' if errors(problems) else None):
+            # the render runs in a process of the background pool, a rerun picks up its progress and result
+            if 'render_job' in st.session_state:
+                st.session_state['render_job'].cancel()
+            session_key = (image_value, height, tolerance, min_area)
+            job_backend = model_backend(backend, out)
+            cache_key = model_key(image_digest, filetype, scales, tran, rot, height, out, hinges, job_backend, (tolerance, min_area), tessellation)
+            cached = artifact_cache.get(cache_key) if artifact_cache else None
+            # sizes of the render for the metrics, the job adds the faces and the output bytes
+            render_stats = {'input_bytes': len(bytes_data), 'input_pixels': input_pixels(bytes_data, filetype),
+                            'segments': segments, 'simplified_segments': simplified_segments, 'hinges': len(expanded)}
+            if cached is not None:
+                render_stats['output_bytes'] = len(cached)
+                st.session_state['render_job'] = RenderJob.from_result((cached, dict(), render_stats, None, None))
+            elif job_backend == 'mesh':
+                st.session_state['render_job'] = RenderJob(mesh_job, outline, deepcopy(expanded), height, cache_key, render_stats, out)
+            else:
+                # the incremental render starts from the session (pickled) of the last render
+                state = memory_store.get(st.session_state['render_state']) if incremental and 'render_state' in st.session_state else None
+                st.session_state['render_job'] = RenderJob(session_job, state, session_key, outline, deepcopy(expanded), render_mode,
+                                                           height, out, cache_key, render_stats, tessellation, keep=incremental)
+            st.session_state['render_info'] = (render_mode if job_backend == 'cadquery' else 'mesh', len(expanded), out, cache_key)
+            st.session_state['render_stats'] = render_stats
+            st.session_state['render_labels'] = {'input': uploaded_file.name, 'backend': job_backend, 'mode': render_mode, 'out': out}
+        preview_key = artifact_key('preview', image_digest, filetype, scales, tran, rot, height, tolerance, min_area, st.session_state['hinges'], [color[ind-1] for ind in st.session_state['hinges']], preview_engine)
+        cached = artifact_cache.get(preview_key) if artifact_cache else None
+        if cached is not None:
+            workspace.write('preview.png', cached)
         else:
-            print('Rendering')
             start = time.time()
-            # run openscad
-            with st.spinner('Rendering in progress...'):
-                res = cq.importers.importDXF("file.dxf").wires().toPending().extrude(height)
-                for h in hinges.values():
-                    if h['type'] == 'normal':
-                        res = normal_hinge(h, res)
-                    else:
-                        res = ball_joint(h, res)
-                cq.exporters.export(res, f'file.{out}')
-            end = time.time()
-            st.success(f'Rendered in {int(end-start)} seconds', icon="✅")
-
-        if preview:
-            if 'preview.png' not in os.listdir():
-                st.error('OpenScad was not able to generate the preview', icon="🚨")
-                st.stop()
+            subprocess_seconds = 0.0
+            preview_error = ''
+            if preview_engine == 'native':
+                try:
+                    workspace.write('preview.png', draw_preview(outline, expanded, hinge_colors))
+                except Exception as e:
+                    # recorded with the openscad preview drawn instead
+                    preview_error = f'native preview: {type(e).__name__}: {e}'
+                    preview_engine = 'openscad'
+            if preview_engine == 'openscad':
+                # the svg of the image read by openscad, the outline may have been traced by another session
+                if st.session_state.get('svg_key') != outline_key or not workspace.exists('file.svg'):
+                    traced = memory_store.get(outline_key) or trace_image(bytes_data, filetype)
+                    workspace.write('file.svg', traced[1])
+                    st.session_state['svg_key'] = outline_key
+                height_model = height/2
+                openscad_template = preview_template
+                # resize the scale of the svg
+                templ = openscad_template.format(HEIGHT=height_model, X_TRAN=tran[0], Y_TRAN=tran[1], X_SCALE=scales[0], Y_SCALE=scales[1], Z_DEG=rot)
+                run = build_preview(expanded, templ, hinge_colors)
+                workspace.write('run.scad', run)
+                subprocess_start = time.time()
+                subprocess.run('xvfb-run -a openscad -o preview.png --camera 0,0,0,0,0,0,0 --autocenter --viewall --view axes,scales  --projection=ortho run.scad', shell = True, cwd=workspace.path)
+                subprocess_seconds = time.time() - subprocess_start
+            st.session_state['preview_metrics'] = preview_record(preview_engine, time.time() - start, subprocess_seconds, preview_error)
+            record(st.session_state['preview_metrics'])
+            if artifact_cache and workspace.exists('preview.png'):
+                with open(workspace.file('preview.png'), 'rb') as f:
+                    artifact_cache.put(preview_key, f.read())
+
+        job = st.session_state.get('render_job')
+        if job is not None and job.done():
+            # the finished render leaves the session, recorded once: the model and the session of the
+            # next incremental render go to the shared store, the session keeps only their keys
+            del st.session_state['render_job']
+            job_mode, job_hinges, job_out, job_key = st.session_state['render_info']
+            timings = dict()
+            if job.status == 'done':
+                # the worker sends back the sizes of the model and the counters of its hinge cache
+                model, timings, st.session_state['render_stats'], state, cache_stats = job.result
+                if cache_stats is not None:
+                    st.session_state['hinge_cache_stats'] = cache_stats
+                memory_store.put(job_key, model, len(model))
+                if state is not None:
+                    state_key = artifact_key('render-state', job_key)
+                    memory_store.put(state_key, state, len(state))
+                    st.session_state['render_state'] = state_key
+            status = {'done': 'cached' if job.cached else 'ok', 'failed': 'error', 'cancelled': 'cancelled'}[job.status]
+            seconds = (job.finished or time.time()) - (job.started or job.submitted)
+            record(render_record(seconds, timings, st.session_state['render_stats'], status, error=job.error or '', **st.session_state['render_labels']))
+            st.session_state['render_result'] = {'status': job.status, 'cached': job.cached, 'seconds': seconds, 'timings': timings,
+                                                 'info': st.session_state['render_info']}
+            job = None
+        result = st.session_state.get('render_result')
+        if job is not None:
+            col1, col2 = st.columns([4, 1])
+            with col1:
+                st.progress(job.progress, text=f'Rendering in progress: {job.message}' if job.status == 'running' else 'Render queued, waiting for a free worker')
+            with col2:
+                if st.button('Cancel render'):
+                    job.cancel()
+                    st.rerun()
+        elif result is not None:
+            job_mode, job_hinges, job_out, job_key = result['info']
+            # the model may have left the store (least recently used), the disk cache may still have it
+            model = memory_store.get(job_key) if result['status'] == 'done' else None
+            if model is None and result['status'] == 'done' and artifact_cache:
+                model = artifact_cache.get(job_key)
+            if result['status'] == 'cancelled':
+                st.warning('Render cancelled', icon="⚠️")
+            elif result['status'] == 'failed':
+                # the error is in the render record
+                st.error('The program was not ot able to generate the mesh', icon="🚨")
+            elif model is None:
+                st.warning('The model is not in memory anymore, render it again', icon="⚠️")
+            else:
+                timings = result['timings']
+                if result['cached']:
+                    st.success('Model read from the cache', icon="✅")
+                else:
+                    st.success(f"Rendered in {int(result['seconds'])} seconds", icon="✅")
+                st.write(f'{job_mode} render of {job_hinges} hinges')
+                with st.expander('Render metrics'):
+                    render_stats = st.session_state['render_stats']
+                    st.table({'stage': list(timings), 'seconds': [round(t, 3) for t in timings.values()]})
+                    st.write(', '.join(f"{size.replace('_', ' ')} {value:,}" for size, value in render_stats.items()))
+                    if 'trace_seconds' in st.session_state:
+                        st.write(f"Trace of the image: {st.session_state['trace_seconds']:.2f} s")
+                    if 'preview_metrics' in st.session_state:
+                        preview = st.session_state['preview_metrics']
+                        st.write(f"Last {preview['engine']} preview: {preview['seconds']:.2f} s, of which {preview['subprocess_seconds']:.2f} s in openscad")
+                    store_stats = memory_store.stats()
+                    st.write(f"Shared store: {store_stats['entries']} outlines and models, {store_stats['bytes']/2**20:.1f}/{store_stats['max_bytes']/2**20:.0f} MB")
+                    if 'hinge_cache_stats' in st.session_state:
+                        # the cache of the render worker of the last render, the workers do not share it
+                        cache_stats = st.session_state['hinge_cache_stats']
+                        st.write(f"Hinge cache of the render worker: {cache_stats['hits']} hits, {cache_stats['misses']} misses, {cache_stats['size']}/{cache_stats['maxsize']} entries")
+                    if artifact_cache:
+                        artifact_stats = artifact_cache.stats()
+                        st.write(f"Artifact cache: {artifact_stats['hit_rate']:.0%} hit rate, {artifact_stats['bytes']/2**20:.1f}/{artifact_stats['max_bytes']/2**20:.0f} MB")
+                btn = st.download_button(
+                        label=f"Download {job_out}",
+                        data=model,
+                        file_name=f'flexi.{job_out}',
+                        mime=f"model/{job_out}"
+                    )
+
+        if not workspace.exists('preview.png'):
+            st.error('Not able to generate the preview', icon="🚨")
+        else:
             colors_text = 'Quick preview:'
             for index in st.session_state['hinges']:
                 colors_text = colors_text + f' <span style="color:{color[index-1]}">Hinge {index},</span>'
             st.markdown(colors_text, unsafe_allow_html=True)
-            image = Image.open('preview.png')
-            st.image(image, caption='Openscad preview')
+            image = Image.open(workspace.file('preview.png'))
+            st.image(image, caption='Openscad preview' if preview_engine == 'openscad' else 'Top view preview')
             image.close()
-        else:
-            if f'file.{out}' not in os.listdir():
-                st.error('The program was not ot able to generate the mesh', icon="🚨")
-                st.stop()
-            with open(f'file.{out}', "rb") as file:
-                btn = st.download_button(
-                        label=f"Download {out}",
-                        data=file,
-                        file_name=f'flexi.{out}',
-                        mime=f"model/{out}"
-                    )
-            #html = create_download_link(file.read(), "model")
-            #st.markdown(html, unsafe_allow_html=True)
-            #if out=='stl':
-                #st.write('Interactive mesh preview:')
-                #st.plotly_chart(figure_mesh(f'file.stl'), use_container_width=True)
+        #html = create_download_link(file.read(), "model")
+        #st.markdown(html, unsafe_allow_html=True)
+        #if out=='stl':
+            #st.write('Interactive mesh preview:')
+            #st.plotly_chart(figure_mesh(f'file.stl'), use_container_width=True)
         st.markdown("Please, put a like [on Printables](https://www.printables.com/it/model/505713-flexifier-make-it-flexi) to support the project!", unsafe_allow_html=True)
         st.markdown("I am a student who enjoys 3D printing and programming. If you want to support me with a coffee, just [click here!](https://www.paypal.com/donate/?hosted_button_id=V4LJ3Z3B3KXRY)", unsafe_allow_html=True)
 
+        # poll the background render until it is over
+        if job is not None and not job.done():
+            time.sleep(1)
+            st.rerun()
@@ -0,0 +1,43 @@
+import os
+import time
+import pytest
+import flexifier_batch
+
+def fake_job(ind, job, results):
+    # the workers of the test: the job says what the worker does
+    if job['do'] == 'ok':
+        results.put((ind, 'ok', 3, dict(), dict(), ''))
+    elif job['do'] == 'exit':
+        # the result is sent and the worker exits right away
+        results.put((ind, 'ok', 3, dict(), dict(), ''))
+        results.close()
+        results.join_thread()
+        os._exit(0)
+    elif job['do'] == 'crash':
+        os._exit(3)
+    elif job['do'] == 'twice':
+        # a second result after the first one, as the result of a job killed when it was sent
+        results.put((ind, 'ok', 3, dict(), dict(), ''))
+        time.sleep(0.5)
+        results.put((ind, 'error', 0, dict(), dict(), 'late'))
+    else:
+        time.sleep(60)
+
+@pytest.fixture
+def jobs(monkeypatch, tmp_path):
+    monkeypatch.setattr(flexifier_batch, 'run_job', fake_job)
+    monkeypatch.setattr(flexifier_batch, 'record', lambda *args: None)
+    def make(*actions):
+        return [{'do': do, 'input': f'{do}.png', 'output': str(tmp_path / f'{do}.stl'), 'backend': 'cadquery', 'mode': 'batched', 'out': 'stl'}
+                for do in actions]
+    return make
+
+def test_run_jobs_status(jobs):
+    reports = flexifier_batch.run_jobs(jobs('ok', 'exit', 'crash', 'hang'), 4, 1.0)
+    assert [report['status'] for report in reports] == ['ok', 'ok', 'error', 'timeout']
+    assert 'code 3' in reports[2]['error']
+
+def test_late_result_is_dropped(jobs):
+    # the result of a job already over does not change its record
+    reports = flexifier_batch.run_jobs(jobs('twice', 'hang'), 2, 1.5)
+    assert [report['status'] for report in reports] == ['ok', 'timeout']
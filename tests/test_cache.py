@@ -0,0 +1,84 @@
+import os
+import numpy as np
+import flexifier
+from flexifier import HingeCache, default_hinge, hinge_parts
+from flexifier_cache import ArtifactCache, MemoryStore
+
+def counting_build():
+    built = list()
+    def build(h, height):
+        built.append(h['h_diam'])
+        return [f"part {h['h_diam']}"], list()
+    return built, build
+
+def test_hinge_cache_hits_and_misses():
+    built, build = counting_build()
+    cache = HingeCache(4, build=build)
+    h = default_hinge(10)
+    assert cache.get(h, 10) is cache.get(dict(h, h_tran=[30.0, 5.0], h_rot=45.0), 10)
+    assert built == [10]
+    # the diameter and the height change the parts
+    cache.get(dict(h, h_diam=8.0), 10)
+    cache.get(h, 12)
+    assert built == [10, 8.0, 10]
+    assert cache.stats() == {'size': 3, 'maxsize': 4, 'hits': 1, 'misses': 3, 'hit_rate': 0.25}
+    cache.clear()
+    assert cache.stats()['size'] == cache.stats()['hits'] == 0
+
+def test_hinge_cache_drops_the_least_recently_used():
+    built, build = counting_build()
+    cache = HingeCache(2, build=build)
+    a, b, c = (dict(default_hinge(10), h_diam=d) for d in (6.0, 7.0, 8.0))
+    for h in (a, b, a, c):
+        cache.get(h, 10)
+    assert built == [6.0, 7.0, 8.0]
+    cache.get(a, 10)
+    cache.get(b, 10)
+    assert built == [6.0, 7.0, 8.0, 7.0]
+    assert cache.stats()['size'] == 2
+
+def test_placed_hinges_share_the_cached_shapes():
+    flexifier.hinge_cache.clear()
+    h = dict(default_hinge(10), h_break_len=40.0)
+    first = hinge_parts(h, 10)
+    second = hinge_parts(dict(h, h_tran=[25.0, -3.0], h_rot=30.0), 10)
+    assert flexifier.hinge_cache.stats()['misses'] == 1
+    for one, other in zip(first[0] + first[1], second[0] + second[1]):
+        # the same shape at another place
+        assert one.wrapped.IsPartner(other.wrapped) and not one.wrapped.IsSame(other.wrapped)
+        assert np.isclose(one.Volume(), other.Volume())
+
+def disk_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+def test_artifact_cache_size_and_eviction(tmp_path):
+    cache = ArtifactCache(str(tmp_path), 100)
+    cache.put('a', b'a' * 40)
+    cache.put('b', b'b' * 40)
+    # an overwrite counts the new size only
+    cache.put('a', b'A' * 10)
+    assert cache.size == disk_size(tmp_path) == 50
+    assert cache.get('a') == b'A' * 10 and cache.get('missing') is None
+    cache.put('c', b'c' * 40)
+    # the modification time is the last use: b is the least recently used
+    for age, key in enumerate(('c', 'a', 'b')):
+        os.utime(cache.file(key), (1000 - age * 100, 1000 - age * 100))
+    cache.put('d', b'd' * 30)
+    assert not os.path.exists(cache.file('b'))
+    assert cache.size == disk_size(tmp_path) <= 90
+    # too big for the cache
+    cache.put('e', b'e' * 200)
+    assert cache.get('e') is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 2
+
+def test_memory_store_keeps_the_recently_used():
+    store = MemoryStore(100)
+    store.put('a', 'A', 40)
+    store.put('b', 'B', 40)
+    store.put('a', 'A2', 30)
+    assert store.stats()['bytes'] == 70
+    store.get('a')
+    store.put('c', 'C', 40)
+    assert store.get('b') is None and store.get('a') == 'A2' and store.get('c') == 'C'
+    store.put('big', 'X', 101)
+    assert store.get('big') is None and store.stats()['bytes'] == 70
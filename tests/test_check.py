@@ -0,0 +1,44 @@
+import numpy as np
+from flexifier import default_hinge
+from flexifier_check import BoxGrid, errors, validate
+
+plate = [np.array([[-60.0, -15.0], [60.0, -15.0], [60.0, 15.0], [-60.0, 15.0]])]
+
+def hinge(x, **values):
+    return dict(default_hinge(10.0), **dict(dict(h_tran=[x, 0.0], h_break_len=60.0), **values))
+
+def brute_query(boxes, box):
+    return [ind for ind, b in enumerate(boxes) if b[0] <= box[2] and box[0] <= b[2] and b[1] <= box[3] and box[1] <= b[3]]
+
+def test_box_grid_matches_brute_force():
+    rng = np.random.default_rng(2)
+    corners = rng.uniform(0, 100, (300, 2))
+    boxes = np.c_[corners, corners + rng.uniform(0, 20, (300, 2))]
+    grid = BoxGrid(boxes)
+    for box in list(np.c_[corners[:50], corners[:50] + 5]) + [(-10, -10, 200, 200), (50, 50, 50, 50), (200, 200, 210, 210)]:
+        assert sorted(grid.query(np.asarray(box, dtype=float)).tolist()) == brute_query(boxes, box)
+
+def test_box_grid_infinite_query():
+    grid = BoxGrid([(0, 0, 1, 1), (5, 0, 6, 1), (5, 5, 6, 6)])
+    assert sorted(grid.query(np.array([2, 0.5, np.inf, 0.5])).tolist()) == [1]
+    assert BoxGrid(np.zeros((0, 4))).query(np.array([0.0, 0.0, 1.0, 1.0])).tolist() == []
+
+def test_valid_hinges():
+    assert validate(plate, {1: hinge(-30), 2: hinge(30)}, 10) == []
+
+def test_overlapping_hinges():
+    assert errors(validate(plate, {1: hinge(0), 2: hinge(2)}, 10)) == ['hinge 1 and hinge 2 overlap']
+
+def test_hinge_outside_the_outline():
+    assert errors(validate(plate, {1: hinge(100)}, 10)) == ['the cut of hinge 1 misses the outline']
+    # the cut crosses the plate, the parts of the hinge stick out of its end
+    assert errors(validate(plate, {1: hinge(58)}, 10)) == ['hinge 1 is out of the model: not enough material for the diameter and the thickness']
+
+def test_short_cut_and_sizes():
+    assert errors(validate(plate, {1: hinge(0, h_break_len=10)}, 10)) == ['the cut of hinge 1 does not separate the part, make it longer or move it']
+    assert 'bigger than the model height' in errors(validate(plate, {1: hinge(0, h_diam=12)}, 10))[0]
+    assert errors(validate([], {1: hinge(0)}, 10)) == ['the image has no outline to extrude']
+
+def test_names_in_messages():
+    problems = validate(plate, {1: hinge(0), 2: hinge(2)}, 10, names={1: '1.1', 2: '1.2'})
+    assert errors(problems) == ['hinge 1.1 and hinge 1.2 overlap']
@@ -0,0 +1,19 @@
+from concurrent.futures import ThreadPoolExecutor
+import cadquery as cq
+from OCP.BRep import BRep_Tool
+from OCP.TopLoc import TopLoc_Location
+from flexifier_export import shape_mesh
+
+def test_concurrent_exports_of_shared_faces():
+    # the moved parts share their faces with the part, as the hinges of hinge_cache
+    part = cq.Workplane('XY').box(10, 10, 4).faces('>Z').workplane().hole(3).val()
+    moved = [part.moved(cq.Location(cq.Vector(20 * ind, 0, 0))) for ind in range(4)]
+    fine, coarse = (0.01, 0.05), (0.5, 0.5)
+    counts = [len(shape_mesh(part, *tolerance)[1]) for tolerance in (fine, coarse)]
+    assert counts[0] > counts[1]
+    jobs = [(shape, tolerance) for _ in range(5) for shape in [part] + moved for tolerance in (fine, coarse)]
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda job: len(shape_mesh(job[0], *job[1])[1]), jobs))
+    assert results == [counts[0] if tolerance == fine else counts[1] for _, tolerance in jobs]
+    # the shape is not meshed in place
+    assert all(BRep_Tool.Triangulation_s(face.wrapped, TopLoc_Location()) is None for face in part.Faces())
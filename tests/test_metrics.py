@@ -0,0 +1,9 @@
+import os
+from flexifier_metrics import write_text
+
+def test_text_file_readable_by_the_collector(tmp_path):
+    path = tmp_path / 'flexifier.prom'
+    write_text(str(path))
+    assert os.stat(path).st_mode & 0o777 == 0o644
+    assert 'flexifier_' in path.read_text()
+    assert os.listdir(tmp_path) == ['flexifier.prom']
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+from flexifier_outline import outline_faces, ring_areas, ring_nesting, simplify_outline
+from flexifier_preview import draw_preview, even_odd_mask
+
+def square(r, x=0.0, y=0.0):
+    return np.array([[x - r, y - r], [x + r, y - r], [x + r, y + r], [x - r, y + r]])
+
+def test_nesting_of_nested_rings():
+    # the orientation of the rings does not matter
+    rings = [square(2), square(10)[::-1], square(6), square(0.5, 20), square(8)[::-1], square(0.3, 20)]
+    parent, depth = ring_nesting(rings)
+    assert parent.tolist() == [2, -1, 4, -1, 1, 3]
+    assert depth.tolist() == [3, 0, 2, 0, 1, 1]
+
+def test_nesting_of_hooked_rings():
+    # two C shapes hooked into each other inside a square: each one is right of the other
+    first = np.array([[0, 0], [6, 0], [6, 1], [1, 1], [1, 5], [6, 5], [6, 6], [0, 6]], dtype=float)
+    second = np.array([[3, 2.5], [9, 2.5], [9, 8.5], [3, 8.5], [3, 7.5], [8, 7.5], [8, 3.5], [3, 3.5]])
+    parent, depth = ring_nesting([square(20, 4, 4), first, second[::-1]])
+    assert parent.tolist() == [-1, 0, 0]
+    assert depth.tolist() == [0, 1, 1]
+
+def test_outline_faces():
+    faces = outline_faces([square(1), square(5), square(3), square(1, 20)])
+    assert len(faces) == 3
+    outer, holes = faces[0]
+    assert np.array_equal(outer, square(5)) and len(holes) == 1 and np.array_equal(holes[0], square(3))
+    assert sorted(len(holes) for _, holes in faces) == [0, 0, 1]
+
+def test_even_odd_mask():
+    # a 6x6 square with a 2x2 hole, in pixels
+    rings = [square(3, 4, 4), square(1, 4, 4)]
+    mask = even_odd_mask(np.concatenate(rings), np.array([4, 4]), 8, 8)
+    expected = np.zeros((8, 8), dtype=bool)
+    expected[1:7, 1:7] = True
+    expected[3:5, 3:5] = False
+    assert np.array_equal(mask, expected)
+
+def test_draw_preview():
+    hinge = {'type': 'normal', 'h_tran': [0.0, 0.0], 'h_rot': 0.0, 'h_break': 3.0, 'h_break_len': 30.0,
+             'h_diam': 10.0, 'h_thick': 5.0, 'h_expose': True}
+    png = draw_preview([square(10), square(3, 5, 5)], {1: hinge}, ['red'])
+    assert png.startswith(b'\x89PNG')
+
+def deviation(original, simplified):
+    # largest distance of the original points from the segments of the simplified ring
+    a, b = simplified, np.roll(simplified, -1, axis=0)
+    ab = b - a
+    p = original[:, None, :]
+    t = np.clip(((p - a) * ab).sum(axis=2) / (ab * ab).sum(axis=1), 0, 1)
+    return np.hypot(*(a + ab * t[..., None] - p).transpose(2, 0, 1)).min(axis=1).max()
+
+def wiggly_ring(count=2000, radius=20.0):
+    rng = np.random.default_rng(1)
+    angles = np.linspace(0, 2 * np.pi, count, endpoint=False)
+    r = radius + np.cumsum(rng.normal(0, 0.05, count))
+    r -= np.linspace(0, r[-1] - r[0], count)
+    return np.c_[r * np.cos(angles), r * np.sin(angles)]
+
+# a long segment turning less than the merge angle, and a fine arc
+bent = np.array([[0, 0], [100, 0.5], [200, 0], [200, 100], [0, 100]], dtype=float)
+arc = np.r_[500 * np.c_[np.cos(np.linspace(0, 1, 60)), np.sin(np.linspace(0, 1, 60))], [[0.0, 0.0]]]
+
+@pytest.mark.parametrize('ring', [wiggly_ring(), bent, arc], ids=['wiggly', 'bent', 'arc'])
+@pytest.mark.parametrize('tolerance', [0.0, 0.01, 0.05, 0.2])
+def test_simplify_within_tolerance(ring, tolerance):
+    simplified, = simplify_outline([ring], tolerance)
+    assert len(simplified) <= len(ring)
+    assert deviation(ring, simplified) <= tolerance + 1e-9
+
+def test_simplify_removes_points():
+    ring = wiggly_ring()
+    assert len(simplify_outline([ring], 0.05)[0]) < len(ring) / 2
+    # exactly collinear points go with any tolerance
+    line = np.array([[0, 0], [1, 0], [2, 0], [3, 0], [3, 1], [0, 1]], dtype=float)
+    assert len(simplify_outline([line], 0.0, min_area=0.1)[0]) == 4
+
+def test_simplify_min_area():
+    rings = [wiggly_ring(), np.array([[0, 0], [1, 0], [1, 1], [0, 1]], dtype=float) + 50]
+    simplified = simplify_outline(rings, 0.0, min_area=2.0)
+    assert len(simplified) == 1
+    assert ring_areas(simplified)[0] > 2.0
@@ -0,0 +1,118 @@
+import pickle
+import time
+from copy import deepcopy
+import numpy as np
+import pytest
+import flexifier
+from flexifier import (Cancelled, RenderJob, RenderSession, default_hinge, default_pattern, expand_hinges, extrude_outline,
+                       hinge_names, pattern_hinges, principal_axis, render_modes, session_job)
+
+outline = [np.array([[-60.0, -15.0], [60.0, -15.0], [60.0, 15.0], [-60.0, 15.0]])]
+
+def hinges(height, *xs):
+    return {ind: dict(default_hinge(height), h_tran=[x, 0.0], h_break_len=60.0) for ind, x in enumerate(xs, start=1)}
+
+def base(height):
+    return lambda: extrude_outline(outline, height)
+
+def test_cancelled_render_resets_the_session():
+    session = RenderSession()
+    session.render('10', base(10), hinges(10, -30, 30), 'batched', 10)
+
+    def cancel(done, total, message=''):
+        if message.startswith('cut'):
+            raise Cancelled()
+
+    with pytest.raises(Cancelled):
+        session.render('20', base(20), hinges(20, -30, 30), 'batched', 20, cancel)
+    assert session.key is None and session.base is None and session.result is None
+    # the next render starts over instead of splicing the new base in the old model
+    moved = hinges(10, -35, 30)
+    model, _ = session.render('10', base(10), moved, 'batched', 10)
+    full, _ = RenderSession().render('10', base(10), moved, 'batched', 10)
+    assert model.findSolid().BoundingBox().zmax == pytest.approx(10)
+    assert model.findSolid().Volume() == pytest.approx(full.findSolid().Volume())
+
+def test_finished_job_keeps_only_the_result():
+    job = RenderJob(session_job, None, '10', outline, hinges(10, 0), 'batched', 10, 'stl')
+    start = time.time()
+    while not job.done() and time.time() - start < 300:
+        time.sleep(0.1)
+    assert job.status == 'done', job.error
+    model, timings, stats, state, cache_stats = job.result
+    assert len(model) > 84  # binary stl header and count
+    assert pickle.loads(state).key == '10'
+    # the hinge cache of the worker built the parts of the hinge
+    assert cache_stats['misses'] >= 1 and cache_stats['size'] >= 1
+    # the arguments go with the future
+    assert job.future is None
+
+def patterned(kind, tran=(0.0, 0.0), rot=0.0, **values):
+    return dict(default_hinge(10), h_tran=list(tran), h_rot=rot, pattern=dict(default_pattern(kind), **values))
+
+def places(expanded):
+    return np.array([h['h_tran'] for h in expanded]), np.array([h['h_rot'] for h in expanded])
+
+def test_line_pattern():
+    h = patterned('line', (10.0, 5.0), 10.0, count=3, step=20.0, angle=90.0)
+    before = deepcopy(h)
+    tran, rot = places(pattern_hinges(h))
+    assert np.allclose(tran, [[10, -15], [10, 5], [10, 25]])
+    assert np.allclose(rot, 100)
+    assert h == before
+    assert all('pattern' not in hinge for hinge in pattern_hinges(h))
+    # an even count is centered on h_tran too
+    tran, _ = places(pattern_hinges(patterned('line', count=2, step=20.0, angle=0.0)))
+    assert np.allclose(tran, [[-10, 0], [10, 0]])
+
+def test_radial_pattern():
+    tran, rot = places(pattern_hinges(patterned('radial', (1.0, 2.0), 5.0, count=4, radius=30.0, angle=45.0)))
+    angles = np.radians([45, 135, 225, 315])
+    assert np.allclose(tran, np.c_[1 + 30 * np.cos(angles), 2 + 30 * np.sin(angles)])
+    assert np.allclose(rot, [50, 140, 230, 320])
+
+def test_axis_pattern():
+    # a 100 x 20 plate turned by 30 degrees around (5, 5)
+    a = np.radians(30)
+    turn = np.array([[np.cos(a), -np.sin(a)], [np.sin(a), np.cos(a)]])
+    plate = [outline[0] / [1.2, 1.5] @ turn.T + 5]
+    center, angle, low, high = principal_axis(plate)
+    assert np.allclose(center, 5)
+    assert angle % 180 == pytest.approx(30)
+    assert (low, high) == pytest.approx((-50, 50))
+    tran, rot = places(pattern_hinges(patterned('axis', (0.0, 1.0), 90.0, count=3), plate))
+    direction = np.array([np.cos(np.radians(angle)), np.sin(np.radians(angle))])
+    assert np.allclose(tran, [5 + offset * direction + [0, 1] for offset in (-25, 0, 25)])
+    assert np.allclose(rot, (angle + 90) % 360)
+    with pytest.raises(ValueError):
+        pattern_hinges(patterned('axis', count=3))
+
+def test_count_zero_is_one_hinge():
+    for kind in ('line', 'radial'):
+        assert len(pattern_hinges(patterned(kind, count=0))) == 1
+    tran, _ = places(pattern_hinges(patterned('line', (3.0, 4.0), count=0)))
+    assert np.allclose(tran, [[3, 4]])
+
+def test_expand_names_and_parents():
+    # entry ids that are not consecutive, the hinges are numbered from 1
+    entries = {1: patterned('line', count=3), 3: default_hinge(10)}
+    expanded, parents = expand_hinges(entries)
+    assert list(expanded) == [1, 2, 3, 4]
+    assert parents == {1: 1, 2: 1, 3: 1, 4: 3}
+    assert hinge_names(parents) == {1: '1.1', 2: '1.2', 3: '1.3', 4: '3'}
+    assert expanded[4] == entries[3]
+    expanded, parents = expand_hinges({2: default_hinge(10), 5: patterned('radial', count=2), 7: patterned('line', count=1)})
+    assert hinge_names(parents) == {1: '2', 2: '5.1', 3: '5.2', 4: '7'}
+
+def test_render_modes_give_the_same_model(monkeypatch):
+    # the pieces are built in this process
+    monkeypatch.setattr(flexifier, 'piece_workers', 1)
+    mixed = hinges(10, -30, 30)
+    mixed[2] = dict(default_hinge(10, 'ball'), h_tran=[30.0, 0.0], h_break_len=60.0)
+    models = {mode: render(mixed, extrude_outline(outline, 10), 10)[0].findSolid() for mode, render in render_modes.items()}
+    volumes = {mode: model.Volume() for mode, model in models.items()}
+    solids = {mode: len(model.Solids()) for mode, model in models.items()}
+    assert volumes['batched'] == pytest.approx(volumes['sequential'], rel=1e-6)
+    assert volumes['pieces'] == pytest.approx(volumes['sequential'], rel=1e-6)
+    # the three pieces between the cuts and the link of the ball joint
+    assert solids['batched'] == solids['sequential'] == solids['pieces'] == 4
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+from flexifier_outline import chord_tolerance, ring_area, svg_outline, units
+
+def svg(body, size='width="100mm" height="100mm" viewBox="0 0 100 100"'):
+    # one svg unit is one mm, y up in the outline
+    return f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" {size}>{body}</svg>'.encode()
+
+def box(rings):
+    points = np.concatenate(rings)
+    return np.r_[points.min(axis=0), points.max(axis=0)]
+
+def test_units_and_view_box():
+    assert np.allclose(box(svg_outline(svg('<rect width="200" height="100"/>', 'width="100mm" height="50mm" viewBox="0 0 200 100"'))),
+                       [0, -50, 100, 0])
+    assert np.allclose(box(svg_outline(svg('<rect width="1" height="1"/>', 'width="2in" height="2in" viewBox="0 0 2 2"'))),
+                       [0, -25.4, 25.4, 0])
+    # without a view box the lengths are px at 72 dpi, like openscad
+    assert np.allclose(box(svg_outline(svg('<rect width="72" height="36"/>', ''))), [0, -12.7, 25.4, 0])
+    assert units['pt'] == pytest.approx(25.4 / 72)
+
+def test_transforms():
+    assert np.allclose(box(svg_outline(svg('<g transform="translate(10,0) scale(2)"><rect width="1" height="1"/></g>'))), [10, -2, 12, 0])
+    assert np.allclose(box(svg_outline(svg('<rect width="10" height="5" transform="rotate(90)"/>'))), [-5, -10, 0, 0])
+    assert np.allclose(box(svg_outline(svg('<rect width="10" height="10" transform="rotate(180 5 5)"/>'))), [0, -10, 10, 0])
+    assert np.allclose(box(svg_outline(svg('<rect width="10" height="10" transform="matrix(1 0 0 1 5 6)"/>'))), [5, -16, 15, -6])
+
+def test_relative_and_smooth_commands():
+    same = [('M0 0 L10 0 L10 10 L0 10 Z', 'm0 0 l10 0 v10 h-10 z'),
+            ('M0 0 C0 10 10 10 10 0 C10 -10 20 -10 20 0 Z', 'M0 0 C0 10 10 10 10 0 S20 -10 20 0 Z'),
+            ('M0 0 Q5 10 10 0 Q15 -10 20 0 Z', 'M0 0 Q5 10 10 0 T20 0 Z'),
+            ('M5 5 c0 10 10 10 10 0 s10 -10 10 0 z', 'M5 5 C5 15 15 15 15 5 S25 -5 25 5 Z'),
+            # implicit lines after a move, arc flags without separators
+            ('M0 0 L10 0 L10 10 Z', 'M0 0 10 0 10 10 Z'),
+            ('M0 0 A10 10 0 0 1 20 0 Z', 'M0 0A10 10 0 0120 0z')]
+    for first, second in same:
+        a, b = svg_outline(svg(f'<path d="{first}"/>')), svg_outline(svg(f'<path d="{second}"/>'))
+        assert len(a) == len(b) == 1 and np.allclose(a[0], b[0]), (first, second)
+
+def test_arcs_within_the_chord_tolerance():
+    ring = svg_outline(svg('<circle cx="50" cy="50" r="40"/>'))[0]
+    assert abs(ring_area(ring)) == pytest.approx(np.pi * 40 ** 2, rel=1e-3)
+    # the half circle of an arc from (0, 0) to (20, 0), above the chord once y is flipped
+    ring = svg_outline(svg('<path d="M0 0 A10 10 0 0 1 20 0 Z"/>'))[0]
+    assert np.allclose(np.hypot(ring[:, 0] - 10, ring[:, 1]), 10)
+    assert ring[:, 1].max() == pytest.approx(10, abs=0.01)
+    # the middle of every chord of the arc is within the tolerance of the circle
+    middle = (ring[1:-1] + ring[2:]) / 2
+    assert np.all(10 - np.hypot(middle[:, 0] - 10, middle[:, 1]) <= chord_tolerance + 1e-9)
+    # the tolerance is in mm: a circle scaled up gets more segments
+    small = svg_outline(svg('<circle r="4"/>'))[0]
+    big = svg_outline(svg('<circle r="4" transform="scale(10)"/>'))[0]
+    assert len(big) > len(small)
+    assert abs(ring_area(big)) == pytest.approx(np.pi * 40 ** 2, rel=1e-3)
+
+def test_use_and_symbol():
+    rings = svg_outline(svg('<defs><rect id="r" width="10" height="10"/></defs><use href="#r" x="20" y="30"/>'))
+    assert len(rings) == 1 and np.allclose(box(rings), [20, -40, 30, -30])
+    rings = svg_outline(svg('<symbol id="s"><rect width="5" height="5"/></symbol>'
+                            '<use xlink:href="#s" transform="translate(10,0)" x="1" y="2"/>'))
+    assert len(rings) == 1 and np.allclose(box(rings), [11, -7, 16, -2])
+    # a group using itself is drawn once more, not forever
+    rings = svg_outline(svg('<g id="g"><rect width="5" height="5"/><use href="#g" x="10"/></g>'))
+    assert len(rings) == 2
+
+def test_hidden_and_empty():
+    rings = svg_outline(svg('<rect width="5" height="5"/><rect width="5" height="5" display="none"/><g style="display: none"><rect width="1" height="1"/></g>'))
+    assert len(rings) == 1
+    with pytest.raises(ValueError):
+        svg_outline(svg('<text x="10" y="10">flexi</text>'))
@@ -0,0 +1,67 @@
+from io import BytesIO
+import numpy as np
+from PIL import Image
+from flexifier_outline import ring_area
+from flexifier_trace import mask_contours, trace
+
+def mask(rows):
+    return np.array([[c == '#' for c in row] for row in rows])
+
+def test_single_pixel():
+    # the ring goes through the middles of the pixel sides: a diamond of half a pixel
+    contours = mask_contours(mask(['...', '.#.', '...']))
+    assert len(contours) == 1
+    assert len(contours[0]) == 4
+    assert abs(ring_area(contours[0])) == 0.5
+
+def test_saddle_gives_two_rings():
+    # two pixels touching by a corner are two regions
+    contours = mask_contours(mask(['#.', '.#']))
+    assert len(contours) == 2
+    assert [abs(ring_area(c)) for c in contours] == [0.5, 0.5]
+
+def test_ring_with_hole():
+    contours = mask_contours(mask(['#####', '#####', '##.##', '#####', '#####']))
+    assert len(contours) == 2
+    areas = sorted(ring_area(c) for c in contours)
+    # 25 pixels minus the 4 corners cut by the diagonals, the hole is turned the other way
+    assert areas[0] == -24.5 and areas[1] == 0.5
+
+def test_straight_runs_keep_only_corners():
+    contours = mask_contours(mask(['......', '.####.', '.####.', '......']))
+    assert len(contours) == 1
+    assert len(contours[0]) == 8
+    assert abs(ring_area(contours[0])) == 8 - 4 * 0.125
+
+def test_min_area():
+    assert mask_contours(mask(['#.', '.#']), min_area=1) == []
+    assert len(mask_contours(mask(['##.', '...', '..#']), min_area=1)) == 1
+
+def test_empty_mask():
+    assert mask_contours(np.zeros((3, 3), dtype=bool)) == []
+
+def test_trace_png():
+    # a black 10x10 square on white, the alpha channel is flattened on white
+    image = Image.new('RGBA', (40, 30), (0, 0, 0, 0))
+    image.paste((0, 0, 0, 255), (5, 10, 15, 20))
+    out = BytesIO()
+    image.save(out, 'png')
+    contours, size = trace(out.getvalue())
+    assert size == (40, 30)
+    assert len(contours) == 1
+    assert abs(ring_area(contours[0])) == 100 - 4 * 0.125
+    # the pixel i spans [i, i + 1]
+    assert contours[0].min(axis=0).tolist() == [5, 10]
+    assert contours[0].max(axis=0).tolist() == [15, 20]
+
+def test_trace_image_in_memory(monkeypatch):
+    # the outline and the svg of the openscad preview come back in memory
+    import flexifier
+    from flexifier_outline import svg_outline
+    monkeypatch.setattr(flexifier, 'artifact_cache', None)
+    image = Image.new('L', (40, 30), 255)
+    image.paste(0, (5, 10, 15, 20))
+    out = BytesIO()
+    image.save(out, 'png')
+    outline, svg = flexifier.trace_image(out.getvalue(), 'png')
+    assert len(outline) == 1 and len(svg_outline(svg)) == 1